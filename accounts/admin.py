@@ -5,6 +5,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from .models import Company
 from django.utils.html import format_html
+from services.thumbnails import field_thumbnail_url
 
 User = get_user_model()
 
@@ -60,7 +61,7 @@ class CustomUserAdmin(UserAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="width:50px; height=50px">',
-                obj.image.url
+                field_thumbnail_url(obj.image)
             )
         return '--'
     avatar.short_description = 'Image'
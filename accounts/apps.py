@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class AccountsConfig(AppConfig):
     name = 'accounts'
+
+    def ready(self):
+        from services.thumbnails import register_thumbnails
+
+        register_thumbnails(self.get_model('User'), 'image')
+        register_thumbnails(self.get_model('Company'), 'logo')
@@ -1,7 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from services.validations import image_validation
-from services.uploads import logo_upload_path, avatar_upload_path
+from services.uploads import image_storage, logo_upload_path, avatar_upload_path
 
 class Company(models.Model):
     name = models.CharField(max_length=200)
@@ -9,7 +9,8 @@ class Company(models.Model):
     email = models.EmailField(unique=True, blank=True, null=True)
     address = models.TextField()
     tax_id = models.CharField(max_length=200)
-    logo = models.ImageField(upload_to=logo_upload_path, validators=[image_validation], blank=True, null=True)
+    logo = models.ImageField(upload_to=logo_upload_path, storage=image_storage, validators=[image_validation], blank=True, null=True)
+    logo_thumbnailed = models.CharField(max_length=100, blank=True, default="", editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateField(auto_now=True)
     
@@ -44,7 +45,8 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='cashier')
     phone = models.CharField(max_length=20, unique=True)
     address = models.TextField(blank=True)
-    image = models.ImageField(upload_to=avatar_upload_path, validators=[image_validation], blank=True, null=True)
+    image = models.ImageField(upload_to=avatar_upload_path, storage=image_storage, validators=[image_validation], blank=True, null=True)
+    image_thumbnailed = models.CharField(max_length=100, blank=True, default="", editable=False)
     branches = models.ManyToManyField(Branch, related_name="users", blank=True)
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(auto_now_add=True)
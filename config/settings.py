@@ -1,5 +1,6 @@
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -85,6 +86,44 @@ DATABASES = {
 }
 
 
+# Retry of transient lock conflicts (deadlocks, serialization failures, "database is locked")
+DB_RETRY_ATTEMPTS = int(os.getenv('DB_RETRY_ATTEMPTS', 4))
+DB_RETRY_BASE_DELAY = float(os.getenv('DB_RETRY_BASE_DELAY', 0.05))
+DB_RETRY_MAX_DELAY = float(os.getenv('DB_RETRY_MAX_DELAY', 1.0))
+
+# Receipt / payment numbers reserved per branch and worker in one round trip
+SEQUENCE_BLOCK_SIZE = int(os.getenv('SEQUENCE_BLOCK_SIZE', 50))
+
+# Cart-time stock holds
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 900))
+STOCK_RESERVATION_SWEEP_INTERVAL = int(os.getenv('STOCK_RESERVATION_SWEEP_INTERVAL', 60))
+
+# Recent checkout customers / addresses remembered per worker
+CUSTOMER_CACHE_SIZE = int(os.getenv('CUSTOMER_CACHE_SIZE', 1024))
+
+# Seconds a worker trusts its barcode/SKU and typeahead indexes before pulling product changes from the database
+PRODUCT_LOOKUP_CHECK_INTERVAL = float(os.getenv('PRODUCT_LOOKUP_CHECK_INTERVAL', 2))
+
+# Product typeahead index: characters kept per key and name words indexed per product
+TYPEAHEAD_KEY_LENGTH = int(os.getenv('TYPEAHEAD_KEY_LENGTH', 32))
+TYPEAHEAD_WORDS = int(os.getenv('TYPEAHEAD_WORDS', 6))
+
+# Most ranked hits the product search returns
+PRODUCT_SEARCH_LIMIT = int(os.getenv('PRODUCT_SEARCH_LIMIT', 200))
+
+# Largest product file the web import accepts; bigger ones go through manage.py import_products
+PRODUCT_IMPORT_MAX_BYTES = int(os.getenv('PRODUCT_IMPORT_MAX_BYTES', 10 * 1024 * 1024))
+PRODUCT_IMPORT_MAX_ROWS = int(os.getenv('PRODUCT_IMPORT_MAX_ROWS', 20000))
+
+# POS catalog sync: delta overlap with the previous version, and how long deletions are remembered
+CATALOG_SYNC_OVERLAP = int(os.getenv('CATALOG_SYNC_OVERLAP', 60))
+CATALOG_TOMBSTONE_DAYS = int(os.getenv('CATALOG_TOMBSTONE_DAYS', 30))
+
+# Image thumbnails: worker processes (0 renders inline) and WebP/JPEG quality
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 80))
+
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -148,6 +187,27 @@ AUTHENTICATION_BACKENDS = [
 SESSION_COOKIE_AGE = int(os.getenv('SESSION_COOKIE_AGE', 86400))
 SESSION_SAVE_EVERY_REQUEST = os.getenv('SESSION_SAVE_EVERY_REQUEST') == 'True'
 
+# Caches; point CACHE_BACKEND / CART_CACHE_BACKEND at a shared cache (e.g. django.core.cache.backends.redis.RedisCache) when running several hosts
+CART_TTL = int(os.getenv('CART_TTL', SESSION_COOKIE_AGE))
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+    'carts': {
+        'BACKEND': os.getenv('CART_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CART_CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'pos-carts')),
+        'TIMEOUT': CART_TTL,
+        # One entry per cart line plus three per cart. Culling past MAX_ENTRIES drops single
+        # lines of live carts, so keep it well above the busiest day (see CacheCartStorage)
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CART_CACHE_MAX_ENTRIES', 500000))},
+    },
+}
+
+# POS cart storage: sales.cart_storage.CacheCartStorage, MemoryCartStorage or SessionCartStorage
+CART_STORAGE = os.getenv('CART_STORAGE', 'sales.cart_storage.CacheCartStorage')
+CART_CACHE_ALIAS = os.getenv('CART_CACHE_ALIAS', 'carts')
+
 # Sweetify
 SWEETIFY_SWEETALERT_LIBRARY = 'sweetalert2'
 
@@ -1,11 +1,19 @@
 from django import forms
-from .models import Customer, CustomerAddress
+from .models import Customer, CustomerAddress, normalize_phone
 
 class CustomerForm(forms.ModelForm):
     class Meta:
         model = Customer
         fields = ['name', 'email', 'phone', 'loyalty_points', 'is_active']
 
+    def clean_phone(self):
+        phone = self.cleaned_data.get('phone')
+        key = normalize_phone(phone)
+        # Spelled differently, the same number still clashes on the unique phone_key
+        if key and Customer.objects.filter(phone_key=key).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError('A customer with this phone number already exists.')
+        return phone
+
 class CustomerAddressForm(forms.ModelForm):
     class Meta:
         model = CustomerAddress
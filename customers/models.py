@@ -1,10 +1,25 @@
+import hashlib
+import re
 from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+def normalize_phone(phone):
+    """Digits only (keeping a leading +), so "+880 1711-000000" and "+8801711000000" match."""
+    phone = (phone or "").strip()
+    digits = re.sub(r"\D", "", phone)
+    if not digits:
+        return None
+    return f"+{digits}" if phone.startswith("+") else digits
+
+def address_hash(address):
+    normalized = " ".join((address or "").split()).lower()
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
 class Customer(models.Model):
     name = models.CharField(max_length=150)
     phone = models.CharField(max_length=20,unique=True,blank=True,null=True)
+    phone_key = models.CharField(max_length=21,unique=True,blank=True,null=True,editable=False)
     email = models.EmailField(unique=True,blank=True,null=True)
     loyalty_points = models.DecimalField(max_digits=10,decimal_places=2, validators=[MinValueValidator(Decimal("0.00"))])
 
@@ -15,11 +30,29 @@ class Customer(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone(self.phone)
+        if kwargs.get("update_fields") and "phone" in kwargs["update_fields"]:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "phone_key"}
+        super().save(*args, **kwargs)
+
 class CustomerAddress(models.Model):
     customer = models.ForeignKey(Customer,on_delete=models.CASCADE,related_name="addresses")
     address = models.TextField()
     city = models.CharField(max_length=100, blank=True, null=True)
     is_default = models.BooleanField(default=False)
+    address_hash = models.CharField(max_length=40, blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["customer", "address_hash"], name="customer_address_hash_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.address_hash = address_hash(self.address)
+        if kwargs.get("update_fields") and "address" in kwargs["update_fields"]:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "address_hash"}
+        super().save(*args, **kwargs)
 
 class LoyaltyTransaction(models.Model):
     customer = models.ForeignKey(Customer,on_delete=models.PROTECT,related_name="loyalty_transactions")
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from customers.models import Customer, CustomerAddress, normalize_phone, address_hash
+
+
+class LRUCache:
+    """Small thread-safe LRU used to skip repeat customer lookups in this worker."""
+
+    def __init__(self, size=None):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > (self.size or settings.CUSTOMER_CACHE_SIZE):
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key, self._data[key])]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# ("phone", phone_key) -> customer id, ("address", customer id, address hash) -> True
+cache = LRUCache()
+
+
+def remember(key, value):
+    # Rows written by a transaction that later rolls back must never be cached
+    transaction.on_commit(lambda: cache.set(key, value))
+
+
+def get_or_create_customer_id(phone, name="", email=None):
+    """
+    Customer id for a checkout phone number, creating the customer if needed.
+    A recent customer is confirmed with a primary key lookup (other workers
+    may have deleted it or changed its phone); otherwise one indexed lookup
+    on phone_key (the raw phone is also matched, for rows saved before
+    phone_key existed).
+    """
+    key = normalize_phone(phone)
+    if key is None:
+        return None
+
+    customer_id = cache.get(("phone", key))
+    if customer_id:
+        if Customer.objects.filter(pk=customer_id, phone_key=key).exists():
+            return customer_id
+        forget_customer(customer_id)
+
+    row = Customer.objects.filter(Q(phone_key=key) | Q(phone=phone)).values_list("id", "phone_key").first()
+    if row:
+        customer_id, phone_key = row
+        if phone_key is None:
+            Customer.objects.filter(pk=customer_id).update(phone_key=key)
+    else:
+        try:
+            with transaction.atomic():
+                customer_id = Customer.objects.create(
+                    phone=phone, name=name or "", email=email or None, loyalty_points=0
+                ).pk
+        except IntegrityError:
+            # Created concurrently by another till
+            customer_id = Customer.objects.filter(phone_key=key).values_list("id", flat=True).first()
+            if customer_id is None:
+                raise
+
+    remember(("phone", key), customer_id)
+    return customer_id
+
+
+def ensure_address(customer_id, address):
+    """Record address for the customer unless it is already known (matched by its indexed hash)."""
+    if not customer_id or not address:
+        return
+
+    digest = address_hash(address)
+    if cache.get(("address", customer_id, digest)):
+        return
+
+    known = CustomerAddress.objects.filter(customer_id=customer_id).filter(
+        Q(address_hash=digest) | Q(address_hash__isnull=True, address=address)
+    ).exists()
+    if not known:
+        CustomerAddress.objects.create(customer_id=customer_id, address=address, is_default=True)
+
+    remember(("address", customer_id, digest), True)
+
+
+def resolve_customer_ids(entries):
+    """
+    Batch counterpart of get_or_create_customer_id / ensure_address.
+    entries is an iterable of (phone, name, email, address); returns a dict
+    mapping each distinct phone to its customer id.
+    """
+    entries = [entry for entry in entries if normalize_phone(entry[0])]
+    ids = {}
+    missing = {}
+    hints = {}
+    for phone, name, email, address in entries:
+        customer_id = cache.get(("phone", normalize_phone(phone)))
+        if customer_id:
+            hints[phone] = customer_id
+        missing.setdefault(phone, (name, email))
+
+    if hints:
+        # Cached ids are only hints (another worker may have deleted the customer
+        # or changed its phone): confirm them all with one primary key query
+        current = dict(Customer.objects.filter(pk__in=set(hints.values())).values_list("id", "phone_key"))
+        for phone, customer_id in hints.items():
+            if current.get(customer_id) == normalize_phone(phone):
+                ids[phone] = customer_id
+                missing.pop(phone)
+            else:
+                forget_customer(customer_id)
+
+    if missing:
+        keys = {normalize_phone(phone): phone for phone in missing}
+        rows = Customer.objects.filter(Q(phone_key__in=keys) | Q(phone__in=missing)).values_list("id", "phone", "phone_key")
+        for customer_id, phone, phone_key in rows:
+            for key in {phone_key, normalize_phone(phone)} & set(keys):
+                ids[keys[key]] = customer_id
+                remember(("phone", key), customer_id)
+
+        for phone, (name, email) in missing.items():
+            if phone not in ids:
+                ids[phone] = get_or_create_customer_id(phone, name, email)
+
+    wanted = {}
+    for phone, _, _, address in entries:
+        if address:
+            digest = address_hash(address)
+            if not cache.get(("address", ids[phone], digest)):
+                wanted[(ids[phone], digest)] = address
+
+    if wanted:
+        rows = CustomerAddress.objects.filter(customer_id__in={customer_id for customer_id, _ in wanted}).filter(
+            Q(address_hash__in={digest for _, digest in wanted})
+            | Q(address_hash__isnull=True, address__in=set(wanted.values()))
+        ).values_list("customer_id", "address_hash", "address")
+        known = {(customer_id, digest or address_hash(address)) for customer_id, digest, address in rows}
+        # bulk_create skips save(), so the hash is set here
+        CustomerAddress.objects.bulk_create([
+            CustomerAddress(customer_id=customer_id, address=address, address_hash=digest, is_default=True)
+            for (customer_id, digest), address in wanted.items()
+            if (customer_id, digest) not in known
+        ])
+        for customer_id, digest in wanted:
+            remember(("address", customer_id, digest), True)
+
+    return ids
+
+
+def forget_customer(customer_id):
+    cache.discard_where(lambda key, value: key[0] == "phone" and value == customer_id)
+    forget_addresses(customer_id)
+
+
+def forget_addresses(customer_id):
+    cache.discard_where(lambda key, value: key[0] == "address" and key[1] == customer_id)
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from customers.models import Customer, CustomerAddress
+from customers import services
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def forget_customer(sender, instance, **kwargs):
+    # The phone may have changed or the row is gone
+    services.forget_customer(instance.pk)
+
+
+@receiver(post_save, sender=CustomerAddress)
+@receiver(post_delete, sender=CustomerAddress)
+def forget_addresses(sender, instance, **kwargs):
+    services.forget_addresses(instance.customer_id)
@@ -0,0 +1,12 @@
+from django import template
+from services.thumbnails import field_thumbnail_url
+
+register = template.Library()
+
+@register.filter
+def thumbnail(value, size="small"):
+    """{{ product.image|thumbnail:"small" }} (WebP) or "small.jpg"; the original while thumbnails are pending."""
+    if not value:
+        return ""
+    size, _, ext = size.partition(".")
+    return field_thumbnail_url(value, size, ext or "webp")
@@ -1,13 +1,14 @@
 from django.contrib import admin
-from .models import Category, Brand, Product, Stock,StockMovement
+from .models import Category, Brand, Product, ProductTombstone, Stock, StockShard, StockMovement, StockReservation
 from django.utils.html import format_html
+from services.thumbnails import field_thumbnail_url
 
 # Register your models here.
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     model = Category
 
-    list_display = ['id', 'name', 'parent', 'is_active']
+    list_display = ['id', 'name', 'parent', 'path', 'is_active']
     list_display_links = ['id', 'name']
     list_filter = ['parent', 'is_active']
     list_per_page = 10
@@ -37,7 +38,7 @@ class ProductAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src={} style="width:50px;height=50px;">',
-                obj.image.url
+                field_thumbnail_url(obj.image)
             )
         return '--'
     preview_image.short_description = 'Image'
@@ -46,12 +47,23 @@ class ProductAdmin(admin.ModelAdmin):
 class StockAdmin(admin.ModelAdmin):
     model = Stock
 
-    list_display = ['id', 'product', 'branch', 'quantity', 'reorder_level']
+    list_display = ['id', 'product', 'branch', 'quantity', 'on_hand', 'shard_count', 'reorder_level']
     list_display_links = ['id', 'product']
     list_filter = ['quantity', 'reorder_level']
     list_per_page = 10
     search_fields = ['product', 'branch']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_on_hand()
+
+@admin.register(StockShard)
+class StockShardAdmin(admin.ModelAdmin):
+    model = StockShard
+
+    list_display = ['id', 'stock', 'index', 'quantity']
+    list_display_links = ['id', 'stock']
+    list_per_page = 10
+
 @admin.register(StockMovement)
 class StockMovementAdmin(admin.ModelAdmin):
     model = StockMovement
@@ -60,4 +72,22 @@ class StockMovementAdmin(admin.ModelAdmin):
     list_display_links = ['id', 'product']
     list_filter = ['created_by', 'movement_type',]
     list_per_page = 10
-    search_fields = ['product', 'branch', 'quantity', ]
\ No newline at end of file
+    search_fields = ['product', 'branch', 'quantity', ]
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    model = StockReservation
+
+    list_display = ['id', 'product', 'branch', 'holder', 'quantity', 'expires_at']
+    list_display_links = ['id', 'product']
+    list_filter = ['branch']
+    list_per_page = 10
+
+@admin.register(ProductTombstone)
+class ProductTombstoneAdmin(admin.ModelAdmin):
+    model = ProductTombstone
+
+    list_display = ['id', 'product_id', 'deleted_at']
+    list_display_links = ['id', 'product_id']
+    list_filter = ['deleted_at']
+    list_per_page = 10
@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class InventoryConfig(AppConfig):
     name = 'inventory'
+
+    def ready(self):
+        from inventory import signals  # noqa: F401
+        from inventory.search import ensure_index
+        from services.stamps import register_stamp
+        from services.thumbnails import register_thumbnails
+
+        post_migrate.connect(ensure_index, sender=self)
+        register_stamp(self.get_model('Product'), 'updated_at', deletions=(self.get_model('ProductTombstone'), 'deleted_at'))
+        register_stamp(self.get_model('Category'), 'version')
+        register_stamp(self.get_model('Brand'), 'version')
+        register_thumbnails(self.get_model('Product'), 'image')
+        register_thumbnails(self.get_model('Brand'), 'logo')
@@ -0,0 +1,103 @@
+import json
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import DecimalField, F
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+from inventory.models import Product, ProductTombstone
+
+FIELDS = ["id", "sku", "barcode", "name", "base_price", "tax_rate", "unit"]
+ROW_FIELDS = ("id", "sku", "barcode", "name", "price", "tax_rate", "unit")
+
+
+def to_version(moment):
+    """Catalog versions are microseconds since the epoch of the sync watermark."""
+    return int(moment.timestamp() * 1_000_000)
+
+
+def from_version(version):
+    return datetime.fromtimestamp(version / 1_000_000, tz=dt_timezone.utc)
+
+
+def catalog_rows(products, *extra):
+    # base_price as in Product.base_price: the discount price unless it is empty or zero
+    return (
+        products
+        .annotate(price=Coalesce(NullIf(F("discount_price"), 0), F("selling_price"), output_field=DecimalField(max_digits=10, decimal_places=2)))
+        .order_by("id")
+        .values_list(*ROW_FIELDS, *extra)
+    )
+
+
+def _line(value):
+    return json.dumps(value, separators=(",", ":"), default=str) + "\n"
+
+
+def catalog_lines(since=None, chunk_size=2000):
+    """
+    NDJSON lines of the catalog: a header, then one compact array per product
+    (FIELDS order), then {"deleted": [...]} lines. Without since, or with a
+    since older than the tombstone retention, this is a full snapshot of the
+    active products; otherwise a delta of what changed after since.
+
+    Deltas overlap the previous version by CATALOG_SYNC_OVERLAP seconds so
+    rows committed late by a long transaction are not missed; applying a line
+    twice is harmless for the terminal.
+    """
+    now = timezone.now()
+    horizon = now - timedelta(days=settings.CATALOG_TOMBSTONE_DAYS)
+    delta = since is not None and from_version(since) > horizon
+
+    yield _line({
+        "type": "delta" if delta else "snapshot",
+        "version": to_version(now),
+        "since": since if delta else None,
+        "fields": FIELDS,
+    })
+
+    if not delta:
+        for row in catalog_rows(Product.objects.filter(is_active=True)).iterator(chunk_size=chunk_size):
+            yield _line(row)
+        return
+
+    changed_after = from_version(since) - timedelta(seconds=settings.CATALOG_SYNC_OVERLAP)
+    deleted = []
+    changed = catalog_rows(Product.objects.filter(updated_at__gt=changed_after), "is_active")
+    for *row, is_active in changed.iterator(chunk_size=chunk_size):
+        if is_active:
+            yield _line(row)
+            continue
+
+        deleted.append(row[0])
+        if len(deleted) >= chunk_size:
+            yield _line({"deleted": deleted})
+            deleted = []
+
+    tombstones = ProductTombstone.objects.filter(deleted_at__gt=changed_after).values_list("product_id", flat=True)
+    for product_id in tombstones.iterator(chunk_size=chunk_size):
+        deleted.append(product_id)
+        if len(deleted) >= chunk_size:
+            yield _line({"deleted": deleted})
+            deleted = []
+
+    if deleted:
+        yield _line({"deleted": deleted})
+
+
+def gzip_stream(lines, flush_size=64 * 1024):
+    """Gzip a stream of text lines incrementally, yielding compressed chunks of about flush_size input bytes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= flush_size:
+            chunk = compressor.compress(b"".join(buffer))
+            buffer, size = [], 0
+            if chunk:
+                yield chunk
+
+    yield compressor.compress(b"".join(buffer)) + compressor.flush()
@@ -0,0 +1,38 @@
+from django.db.models import Case, When
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+from inventory.models import Category
+from inventory.search import search_products
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    SearchFilter served from the product search index (FTS5 / tsvector +
+    trigram): prefix matching, results ordered by relevance. Filters applied
+    before this one (category and the like) narrow the search itself, so the
+    PRODUCT_SEARCH_LIMIT cap counts only matching products. Falls back to the
+    stock icontains search over search_fields when no index is available.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "")
+        product_ids = search_products(query, within=queryset if queryset.query.where else None)
+        if product_ids is None:
+            return super().filter_queryset(request, queryset, view)
+
+        if not product_ids:
+            return queryset.none()
+
+        # Tells ProductCursorPagination to keep this order rather than paginate by id
+        view.search_ranked = True
+        rank = Case(*[When(pk=product_id, then=position) for position, product_id in enumerate(product_ids)])
+        return queryset.filter(pk__in=product_ids).order_by(rank)
+
+
+class CategorySubtreeFilter(BaseFilterBackend):
+    """?category=<id> keeps products of that category and all of its subcategories."""
+
+    def filter_queryset(self, request, queryset, view):
+        category = request.query_params.get("category", "")
+        if not category.isdigit():
+            return queryset
+        return queryset.filter(Category.subtree_q(int(category)))
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Category, Brand, Product, Stock, StockMovement
+from .services import compact_stock
 
 class CategoryForm(forms.ModelForm):
     class Meta:
@@ -26,7 +27,19 @@ class ProductForm(forms.ModelForm):
 class StockForm(forms.ModelForm):
     class Meta:
         model = Stock
-        fields = ['product', 'branch', 'quantity', 'reorder_level']
+        fields = ['product', 'branch', 'quantity', 'reorder_level', 'shard_count']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial['quantity'] = self.instance.on_hand
+
+    def save(self, commit=True):
+        stock = super().save(commit)
+        if commit and (stock.shard_count or 'shard_count' in self.changed_data):
+            # The entered quantity is the new total; spread it over the shards
+            stock = compact_stock(stock, total=self.cleaned_data['quantity'])
+        return stock
 
 class StockMovementForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,314 @@
+import csv
+import io
+import json
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from django.db import DatabaseError, IntegrityError, transaction
+from inventory.lookup import product_lookup
+from inventory.models import Brand, Category, Product
+from inventory.search import index_products
+from inventory.typeahead import product_typeahead
+
+FIELDS = [
+    "sku", "barcode", "name", "description", "category", "brand", "unit",
+    "cost_price", "selling_price", "discount_price", "tax_rate", "is_active", "is_stockable",
+]
+REQUIRED = ("barcode", "name", "category_id", "cost_price", "selling_price", "tax_rate")
+DECIMALS = {"cost_price": 10, "selling_price": 10, "discount_price": 10, "tax_rate": 5}
+LENGTHS = {"sku": 50, "barcode": 50, "name": 200}
+UNITS = {unit for unit, _ in Product.UNIT_CHOICES}
+TRUE = {"1", "true", "yes", "y", "t"}
+FALSE = {"0", "false", "no", "n", "f"}
+CENT = Decimal("0.01")
+
+# A category or brand a row names that does not exist yet; created when the row is saved
+NewGroup = namedtuple("NewGroup", "model name")
+
+
+def detect_format(filename, default="csv"):
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def read_rows(stream, fmt="csv"):
+    """
+    (line number, row dict) pairs from a binary stream of CSV with a header
+    row, or of JSON lines. A line that is not a JSON object comes back as
+    (line, None) so it is reported rather than aborting the import.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+class ProductImporter:
+    """
+    Upserts products by SKU in chunks of chunk_size rows. Category and brand
+    names are resolved through in-memory maps, each chunk is validated and
+    checked for SKU and barcode clashes with two queries, then written with a
+    single upsert (INSERT ... ON CONFLICT (sku) DO UPDATE) in its own
+    transaction. Missing categories and brands are created in that
+    transaction, for rows that passed validation only, unless create_groups
+    is False.
+
+    Columns missing from a row (or None) leave the stored value alone, so a
+    file with only sku and selling_price is a price update. Rows that fail
+    are reported with their line number and do not stop the import.
+    """
+
+    def __init__(self, chunk_size=1000, create_groups=True, max_errors=1000):
+        self.chunk_size = chunk_size
+        self.create_groups = create_groups
+        self.max_errors = max_errors
+        self.categories = {}
+        for category_id, name in Category.objects.order_by("-id").values_list("id", "name"):
+            self.categories[name.strip().lower()] = category_id
+        self.brands = {name.strip().lower(): brand_id for brand_id, name in Brand.objects.values_list("id", "name")}
+        self.created = self.updated = self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        chunk = []
+        for item in rows:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+
+        # The bulk writes bypass the model signals
+        product_lookup.invalidate()
+        product_typeahead.invalidate()
+        return self.summary()
+
+    def summary(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+        }
+
+    def fail(self, line, sku, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "sku": sku, "errors": errors})
+
+    def group_id(self, model, mapping, name, errors, field):
+        key = name.strip().lower()
+        if key in mapping:
+            return mapping[key]
+        if not self.create_groups:
+            errors[field] = f"unknown {field} '{name}'"
+            return None
+        return NewGroup(model, name.strip())
+
+    def create_groups_for(self, products, created):
+        """Swap NewGroup placeholders on products for ids, creating each missing group once."""
+        for product in products:
+            for field, mapping in (("category_id", self.categories), ("brand_id", self.brands)):
+                group = getattr(product, field)
+                if not isinstance(group, NewGroup):
+                    continue
+                key = group.name.lower()
+                if key not in mapping:
+                    mapping[key] = group.model.objects.create(name=group.name).pk
+                    created.append((mapping, key))
+                setattr(product, field, mapping[key])
+
+    def clean(self, row):
+        """Model values for the provided columns of row, and a dict of field errors."""
+        if row is None:
+            return {}, {"row": "not a JSON object"}
+
+        values = {}
+        errors = {}
+        provided = {field: row[field] for field in FIELDS if row.get(field) is not None}
+
+        for field in ("sku", "barcode", "name", "description"):
+            if field in provided:
+                value = str(provided[field]).strip()
+                if not value and field != "description":
+                    errors[field] = "required"
+                elif field in LENGTHS and len(value) > LENGTHS[field]:
+                    errors[field] = f"at most {LENGTHS[field]} characters"
+                values[field] = value
+        if not values.get("sku"):
+            errors["sku"] = "required"
+
+        if "category" in provided:
+            name = str(provided["category"])
+            if name.strip():
+                values["category_id"] = self.group_id(Category, self.categories, name, errors, "category")
+            else:
+                errors["category"] = "required"
+        if "brand" in provided:
+            name = str(provided["brand"])
+            values["brand_id"] = self.group_id(Brand, self.brands, name, errors, "brand") if name.strip() else None
+
+        if "unit" in provided:
+            unit = str(provided["unit"]).strip().lower() or "pcs"
+            if unit not in UNITS:
+                errors["unit"] = f"one of {', '.join(sorted(UNITS))}"
+            values["unit"] = unit
+
+        for field, max_digits in DECIMALS.items():
+            if field not in provided:
+                continue
+            raw = str(provided[field]).strip()
+            if not raw:
+                if field == "discount_price":
+                    values[field] = None
+                else:
+                    errors[field] = "required"
+                continue
+            try:
+                value = Decimal(raw).quantize(CENT)
+            except InvalidOperation:
+                value = None
+            if value is None or not value.is_finite():
+                errors[field] = "not a number"
+                continue
+            if value < 0:
+                errors[field] = "must not be negative"
+            elif len(value.as_tuple().digits) > max_digits:
+                errors[field] = "too large"
+            values[field] = value
+
+        for field in ("is_active", "is_stockable"):
+            if field not in provided:
+                continue
+            raw = str(provided[field]).strip().lower()
+            if raw in TRUE or raw == "":
+                values[field] = True
+            elif raw in FALSE:
+                values[field] = False
+            else:
+                errors[field] = "not a boolean"
+
+        return values, errors
+
+    def import_chunk(self, chunk):
+        cleaned = []
+        skus = set()
+        barcodes = set()
+        for line, row in chunk:
+            values, errors = self.clean(row)
+            sku, barcode = values.get("sku"), values.get("barcode")
+            if sku and sku in skus:
+                errors["sku"] = "duplicate in this file"
+            if barcode and barcode in barcodes:
+                errors["barcode"] = "duplicate in this file"
+            if errors:
+                self.fail(line, sku, errors)
+                continue
+            skus.add(sku)
+            if barcode:
+                barcodes.add(barcode)
+            cleaned.append((line, values))
+
+        existing = Product.objects.in_bulk([values["sku"] for _, values in cleaned], field_name="sku")
+        owners = dict(Product.objects.filter(barcode__in=barcodes).values_list("barcode", "sku"))
+
+        to_save = []
+        saving = []
+        created = 0
+        fields = {"updated_at"}
+        for line, values in cleaned:
+            sku = values["sku"]
+            owner = owners.get(values.get("barcode"))
+            if owner is not None and owner != sku:
+                self.fail(line, sku, {"barcode": f"already used by SKU {owner}"})
+                continue
+
+            product = existing.get(sku)
+            if product is None:
+                missing = [field for field in REQUIRED if field not in values]
+                if missing:
+                    self.fail(line, sku, {field.removesuffix("_id"): "required" for field in missing})
+                    continue
+                product = Product(**values)
+                created += 1
+            else:
+                # Written back by the upsert below (matched on sku, not id)
+                for field, value in values.items():
+                    setattr(product, field, value)
+                product.pk = None
+            fields.update(values)
+            to_save.append(product)
+            saving.append((line, sku))
+
+        fields.discard("sku")
+        created_groups = []
+        try:
+            with transaction.atomic():
+                self.create_groups_for(to_save, created_groups)
+                Product.objects.bulk_create(to_save, update_conflicts=True, unique_fields=["sku"], update_fields=sorted(fields))
+        except (IntegrityError, DatabaseError) as exc:
+            # A concurrent writer took a SKU or barcode; report the whole chunk.
+            # Groups created for it were rolled back too.
+            for mapping, key in created_groups:
+                mapping.pop(key, None)
+            for line, sku in saving:
+                self.fail(line, sku, {"row": f"chunk not saved: {exc}"})
+            return
+
+        self.created += created
+        self.updated += len(to_save) - created
+        index_products(Product.objects.filter(sku__in=[sku for _, sku in saving]).values_list("id", flat=True))
+
+
+def import_products(rows, **options):
+    return ProductImporter(**options).run(rows)
+
+
+def _csv_block(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _jsonl_block(rows):
+    return "".join(json.dumps(dict(zip(FIELDS, row)), separators=(",", ":"), default=str) + "\n" for row in rows)
+
+
+def export_lines(fmt="csv", chunk_size=2000):
+    """
+    Every product as CSV (with a header) or JSON lines in the column layout
+    ProductImporter reads, streamed from a server-side iterator in blocks of
+    chunk_size rows.
+    """
+    rows = Product.objects.order_by("id").values_list(
+        "sku", "barcode", "name", "description", "category__name", "brand__name", "unit",
+        "cost_price", "selling_price", "discount_price", "tax_rate", "is_active", "is_stockable",
+    )
+    encode = _csv_block if fmt == "csv" else _jsonl_block
+    if fmt == "csv":
+        yield encode([FIELDS])
+
+    block = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        block.append(row)
+        if len(block) >= chunk_size:
+            yield encode(block)
+            block = []
+    if block:
+        yield encode(block)
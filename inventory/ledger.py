@@ -0,0 +1,188 @@
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from inventory.models import Product, Stock, StockMovement, StockShard
+from inventory.services import compact_stock
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+# What each movement type does to on-hand stock, as apply_stock_movement applies it
+LEDGER_QUANTITY = Coalesce(
+    Sum(Case(
+        When(movement_type__in=[StockMovement.IN, StockMovement.ADJUSTMENT], then=F("quantity")),
+        When(movement_type=StockMovement.OUT, then=-F("quantity")),
+        default=Value(ZERO),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2),
+    )),
+    Value(ZERO),
+    output_field=models.DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def ledger_totals(branch_id, product_ids=None, chunk_size=5000):
+    """
+    (product id, expected on-hand) for every product with movements at the
+    branch, in product id order. The movements are summed by the database
+    and the per-product totals streamed in chunks, so memory stays flat
+    however long the ledger is.
+    """
+    movements = StockMovement.objects.filter(branch_id=branch_id)
+    if product_ids is not None:
+        movements = movements.filter(product_id__in=product_ids)
+    totals = movements.order_by("product_id").values("product_id").annotate(total=LEDGER_QUANTITY)
+    for row in totals.values_list("product_id", "total").iterator(chunk_size=chunk_size):
+        yield row[0], Decimal(row[1]).quantize(CENT)
+
+
+def stock_totals(branch_id, product_ids=None, chunk_size=5000):
+    """(product id, stock id, on-hand) of the branch's Stock rows in product id order."""
+    stocks = Stock.objects.with_on_hand().filter(branch_id=branch_id)
+    if product_ids is not None:
+        stocks = stocks.filter(product_id__in=product_ids)
+    rows = stocks.order_by("product_id").values_list("product_id", "pk", "quantity", "shard_count", "shard_total")
+    for product_id, stock_id, quantity, shard_count, shard_total in rows.iterator(chunk_size=chunk_size):
+        on_hand = quantity + shard_total if shard_count else quantity
+        yield product_id, stock_id, Decimal(on_hand).quantize(CENT)
+
+
+def compare(stocks, ledger):
+    """
+    Merge two product-ordered streams and yield (product id, stock id or None,
+    on-hand, expected) wherever they disagree. A stock without movements is
+    expected to hold nothing.
+    """
+    stock = next(stocks, None)
+    entry = next(ledger, None)
+    while stock is not None or entry is not None:
+        if entry is None or (stock is not None and stock[0] < entry[0]):
+            product_id, stock_id, on_hand = stock
+            expected = ZERO
+            stock = next(stocks, None)
+        elif stock is None or entry[0] < stock[0]:
+            product_id, expected = entry
+            stock_id, on_hand = None, ZERO
+            entry = next(ledger, None)
+        else:
+            product_id, stock_id, on_hand = stock
+            expected = entry[1]
+            stock = next(stocks, None)
+            entry = next(ledger, None)
+
+        if on_hand != expected:
+            yield product_id, stock_id, on_hand, expected
+
+
+def confirm(branch_id, candidates, repair=False):
+    """
+    Re-read a batch of suspected drifts, so movements written while the branch
+    was being scanned are not reported, and with repair set the Stock rows to
+    what the ledger says. Repairs happen with the Stock rows and their shards
+    locked, so no sale can slip in between the recount and the write.
+    """
+    product_ids = [candidate[0] for candidate in candidates]
+    with transaction.atomic():
+        if repair:
+            locked = list(
+                Stock.objects.select_for_update()
+                .filter(branch_id=branch_id, product_id__in=product_ids)
+                .order_by("product_id")
+                .values_list("pk", flat=True)
+            )
+            list(StockShard.objects.select_for_update().filter(stock_id__in=locked).values_list("pk", flat=True))
+
+        stocks = {row[0]: row for row in stock_totals(branch_id, product_ids)}
+        expected = dict(ledger_totals(branch_id, product_ids))
+        skus = dict(Product.objects.filter(pk__in=product_ids).values_list("pk", "sku"))
+
+        drifts = []
+        for product_id in product_ids:
+            _, stock_id, on_hand = stocks.get(product_id, (product_id, None, ZERO))
+            total = expected.get(product_id, ZERO)
+            if on_hand == total:
+                continue
+            drifts.append({
+                "product_id": product_id,
+                "sku": skus.get(product_id, ""),
+                "stock_id": stock_id,
+                "on_hand": on_hand,
+                "expected": total,
+                "repaired": False,
+            })
+
+        if repair:
+            repair_drifts(branch_id, drifts)
+    return drifts
+
+
+def repair_drifts(branch_id, drifts):
+    """
+    Write the ledger totals over drifted stocks: unsharded rows with one
+    bulk_update, missing rows with one bulk_create, sharded ones through
+    compact_stock. A negative ledger total cannot be stored and is only
+    reported.
+    """
+    now = timezone.now()
+    sharded = set(
+        Stock.objects.filter(pk__in=[drift["stock_id"] for drift in drifts if drift["stock_id"]], shard_count__gt=0)
+        .values_list("pk", flat=True)
+    )
+
+    updates = []
+    creates = []
+    for drift in drifts:
+        if drift["expected"] < 0:
+            continue
+        if drift["stock_id"] is None:
+            creates.append(Stock(product_id=drift["product_id"], branch_id=branch_id, quantity=drift["expected"], reorder_level=5))
+        elif drift["stock_id"] in sharded:
+            compact_stock(Stock(pk=drift["stock_id"]), total=drift["expected"])
+        else:
+            updates.append(Stock(pk=drift["stock_id"], quantity=drift["expected"], updated_at=now))
+        drift["repaired"] = True
+
+    if updates:
+        Stock.objects.bulk_update(updates, ["quantity", "updated_at"])
+    if creates:
+        Stock.objects.bulk_create(creates)
+
+
+def verify_branch(branch_id, repair=False, chunk_size=5000, limit=100):
+    """
+    Compare every Stock row of a branch with its movement ledger. Returns a
+    summary with the number of stocks checked, the drift count, the number
+    repaired and up to limit drift rows. Runs in a worker process.
+    """
+    checked = [0]
+
+    def counted(rows):
+        for row in rows:
+            checked[0] += 1
+            yield row
+
+    summary = {"branch_id": branch_id, "checked": 0, "drifted": 0, "repaired": 0, "drifts": []}
+    batch = []
+
+    def flush():
+        for drift in confirm(branch_id, batch, repair=repair):
+            summary["drifted"] += 1
+            summary["repaired"] += drift["repaired"]
+            if len(summary["drifts"]) < limit:
+                summary["drifts"].append(drift)
+        batch.clear()
+
+    candidates = compare(
+        counted(stock_totals(branch_id, chunk_size=chunk_size)),
+        ledger_totals(branch_id, chunk_size=chunk_size),
+    )
+    for candidate in candidates:
+        batch.append(candidate)
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+
+    summary["checked"] = checked[0]
+    return summary
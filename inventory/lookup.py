@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from inventory.models import Product, ProductTombstone
+
+ProductEntry = namedtuple("ProductEntry", ["id", "name", "barcode", "sku", "base_price", "tax_rate"])
+
+
+def product_entries(chunk_size=2000):
+    rows = Product.objects.filter(is_active=True).values_list(
+        "id", "name", "barcode", "sku", "selling_price", "discount_price", "tax_rate"
+    )
+    for product_id, name, barcode, sku, selling_price, discount_price, tax_rate in rows.iterator(chunk_size=chunk_size):
+        yield ProductEntry(product_id, name, barcode, sku, discount_price or selling_price, tax_rate)
+
+
+def product_entry(product):
+    return ProductEntry(product.pk, product.name, product.barcode, product.sku, product.base_price, product.tax_rate)
+
+
+class VersionedProductIndex:
+    """
+    Base for in-process indexes over the active products.
+
+    Saves and deletes in this process update the index in place (see
+    inventory.signals). Changes made by other workers are pulled from the
+    database at most every PRODUCT_LOOKUP_CHECK_INTERVAL seconds, the way the
+    catalog delta feed does it: products whose updated_at, and tombstones
+    whose deleted_at, are newer than the previous pull (less
+    CATALOG_SYNC_OVERLAP seconds, for transactions that commit late) are
+    applied to the index, or it is rebuilt when there are more than
+    rebuild_after of them. Queryset .update() calls must set updated_at to be
+    seen; invalidate() rebuilds this worker's copy.
+    """
+    rebuild_after = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._since = None
+        self._seen = {}
+        self._checked = 0.0
+
+    def build(self):
+        raise NotImplementedError
+
+    def add(self, data, entry):
+        raise NotImplementedError
+
+    def discard(self, data, product_id):
+        raise NotImplementedError
+
+    def data(self):
+        now = time.monotonic()
+        if self._data is not None and now - self._checked < settings.PRODUCT_LOOKUP_CHECK_INTERVAL:
+            return self._data
+
+        with self._lock:
+            if self._data is not None and now - self._checked < settings.PRODUCT_LOOKUP_CHECK_INTERVAL:
+                return self._data
+
+            started = timezone.now()
+            if self._data is None:
+                self._data = self.build()
+                self._seen = {}
+            else:
+                self._pull(self._since - timedelta(seconds=settings.CATALOG_SYNC_OVERLAP))
+            self._since = started
+            self._checked = now
+            return self._data
+
+    def _pull(self, changed_after):
+        """Apply the products changed and deleted after changed_after that this worker has not applied yet."""
+        rows = Product.objects.filter(updated_at__gt=changed_after).values_list(
+            "id", "name", "barcode", "sku", "selling_price", "discount_price", "tax_rate", "is_active", "updated_at"
+        )
+        changes = []
+        for product_id, name, barcode, sku, selling_price, discount_price, tax_rate, is_active, updated_at in rows:
+            if self._seen.get(product_id) != updated_at:
+                entry = ProductEntry(product_id, name, barcode, sku, discount_price or selling_price, tax_rate)
+                changes.append((product_id, updated_at, entry if is_active else None))
+
+        tombstones = ProductTombstone.objects.filter(deleted_at__gt=changed_after).values_list("product_id", "deleted_at")
+        changes.extend(
+            (product_id, deleted_at, None)
+            for product_id, deleted_at in tombstones
+            if self._seen.get(product_id) != deleted_at
+        )
+
+        # Rows inside the overlap come back on the next pull; remember what was applied
+        self._seen = {product_id: stamp for product_id, stamp in self._seen.items() if stamp > changed_after}
+        self._seen.update((product_id, stamp) for product_id, stamp, _ in changes)
+
+        if len(changes) > self.rebuild_after:
+            self._data = self.build()
+            return
+        for product_id, _, entry in changes:
+            self.discard(self._data, product_id)
+            if entry is not None:
+                self.add(self._data, entry)
+
+    def update(self, product):
+        """Refresh one product after it was saved in this process."""
+        with self._lock:
+            if self._data is not None:
+                self.discard(self._data, product.pk)
+                if product.is_active:
+                    self.add(self._data, product_entry(product))
+                self._seen[product.pk] = product.updated_at
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._data is not None:
+                self.discard(self._data, product_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+
+class ProductLookup(VersionedProductIndex):
+    """
+    Barcode/SKU -> price entry of the active products, used by the POS scan
+    endpoints so a hit never touches the database.
+    """
+    def build(self):
+        data = {"code": {}, "id": {}}
+        for entry in product_entries():
+            self.add(data, entry)
+        return data
+
+    def add(self, data, entry):
+        data["id"][entry.id] = data["code"][entry.sku] = data["code"][entry.barcode] = entry
+
+    def discard(self, data, product_id):
+        entry = data["id"].pop(product_id, None)
+        if entry:
+            data["code"].pop(entry.barcode, None)
+            data["code"].pop(entry.sku, None)
+
+    def get(self, code):
+        """Entry for a barcode or SKU, or None."""
+        return self.data()["code"].get(str(code).strip())
+
+    def get_by_id(self, product_id):
+        return self.data()["id"].get(int(product_id))
+
+
+product_lookup = ProductLookup()
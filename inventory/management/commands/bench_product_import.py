@@ -0,0 +1,55 @@
+import csv
+import io
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from inventory.importer import FIELDS, ProductImporter, export_lines, read_rows
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark the streaming product import (create, then update) and export (all data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options["rows"], options["chunk_size"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def source(self, count, price):
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(FIELDS)
+        for i in range(count):
+            writer.writerow([
+                f"BENCH-IMP-{i}", f"BENCH-IMP-{i}", f"Bench import product {i}", "Benchmark product",
+                f"Bench category {i % 50}", f"bench-import-brand-{i % 200}", "pcs",
+                "1.25", price, "", "5.00", "1", "1",
+            ])
+        return io.BytesIO(text.getvalue().encode())
+
+    def timed(self, label, count, action):
+        started = time.perf_counter()
+        result = action()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<8} {count:>8} rows {elapsed:>8.2f}s {count / elapsed:>10,.0f} rows/s")
+        return result
+
+    def run(self, count, chunk_size):
+        for label, price in [("create", "2.49"), ("update", "2.99")]:
+            stream = self.source(count, price)
+            summary = self.timed(label, count, lambda: ProductImporter(chunk_size=chunk_size).run(read_rows(stream)))
+            if summary["failed"]:
+                self.stdout.write(self.style.WARNING(f"{summary['failed']} rows failed: {summary['errors'][:3]}"))
+
+        size = self.timed("export", count, lambda: sum(len(block) for block in export_lines()))
+        self.stdout.write(f"export size {size / 1024 / 1024:.1f} MB")
@@ -0,0 +1,69 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from inventory.models import Brand, Category, Product
+from inventory.serializers import ProductRowSerializer, ProductSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark ProductSerializer against the values()-based ProductRowSerializer (all data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options["rows"], options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, repeat):
+        category = Category.objects.create(name="Bench")
+        brand = Brand.objects.create(name="bench-serializer")
+        Product.objects.bulk_create([
+            Product(
+                name=f"Bench product {i}",
+                sku=f"BENCH-SER-{i}",
+                barcode=f"BENCH-SER-{i}",
+                description="Benchmark product",
+                category=category,
+                brand=brand,
+                cost_price=Decimal("1.25"),
+                selling_price=Decimal("2.49") + i % 7,
+                discount_price=Decimal("1.99") if i % 3 == 0 else None,
+                tax_rate=Decimal("7.50") if i % 2 else Decimal("5.00"),
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        products = Product.objects.filter(brand=brand).order_by("id")
+
+        renderer = JSONRenderer()
+        full = renderer.render(ProductSerializer(products, many=True).data)
+        fast = renderer.render(ProductRowSerializer(ProductRowSerializer.rows(products), many=True).data)
+        if full != fast:
+            self.stdout.write(self.style.WARNING("Rendered JSON differs between the two serializers"))
+
+        self.stdout.write(f"{'serializer':<22} {'rows/s (query+serialize)':>26} {'rows/s (+render)':>18}")
+        for name, serialize in [
+            ("ProductSerializer", lambda: ProductSerializer(products.all(), many=True).data),
+            ("ProductRowSerializer", lambda: ProductRowSerializer(ProductRowSerializer.rows(products.all()), many=True).data),
+        ]:
+            serialized = rendered = 0.0
+            for _ in range(repeat):
+                started = time.perf_counter()
+                data = serialize()
+                middle = time.perf_counter()
+                renderer.render(data)
+                serialized += middle - started
+                rendered += time.perf_counter() - started
+
+            self.stdout.write(f"{name:<22} {count * repeat / serialized:>26,.0f} {count * repeat / rendered:>18,.0f}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from inventory.models import Stock
+from inventory.services import compact_stock
+
+
+class Command(BaseCommand):
+    help = "Rebalance sharded stock counters (run periodically, e.g. from cron)."
+
+    def handle(self, *args, **options):
+        compacted = 0
+        for stock in Stock.objects.filter(shard_count__gt=0).iterator():
+            stock = compact_stock(stock)
+            compacted += 1
+            self.stdout.write(f"{stock}: {stock.on_hand} over {stock.shard_count} shards")
+
+        # Stocks that were switched back to a single counter but still carry shards
+        for stock in Stock.objects.filter(shard_count=0, shards__isnull=False).distinct().iterator():
+            compact_stock(stock)
+            compacted += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Compacted {compacted} stock rows"))
@@ -0,0 +1,22 @@
+import sys
+from django.core.management.base import BaseCommand
+from inventory.importer import export_lines
+
+
+class Command(BaseCommand):
+    help = "Write every product as CSV or JSON lines in the layout import_products reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        lines = export_lines(options["format"])
+        if not options["output"]:
+            for block in lines:
+                sys.stdout.write(block)
+            return
+
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            for block in lines:
+                output.write(block)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from accounts.models import Company, User
+from inventory.models import Brand, Product
+from django.conf import settings
+from django.db.models import F
+from services.thumbnails import get_pool, marker_field, queue_thumbnails
+
+IMAGE_FIELDS = [(Product, "image"), (Brand, "logo"), (User, "image"), (Company, "logo")]
+
+
+class Command(BaseCommand):
+    help = "Generate missing WebP/JPEG thumbnails for product, brand, user and company images and mark their rows."
+
+    def handle(self, *args, **options):
+        futures = []
+        seen = set()
+        for model, field_name in IMAGE_FIELDS:
+            field = model._meta.get_field(field_name)
+            names = model.objects.exclude(**{field_name: ""}).exclude(**{f"{field_name}__isnull": True})
+            names = names.exclude(**{marker_field(field_name): F(field_name)})
+            for name in names.values_list(field_name, flat=True).iterator():
+                if (model, name) in seen:
+                    continue
+                seen.add((model, name))
+                future = queue_thumbnails(field.attr_class(None, field, name))
+                if future is not None:
+                    futures.append((name, future))
+
+        if futures and settings.THUMBNAIL_WORKERS:
+            # Also waits for the callbacks that write the results to storage
+            get_pool().shutdown(wait=True)
+
+        failed = 0
+        for name, future in futures:
+            if future.exception() is not None:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"{name}: {future.exception()}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Thumbnails generated for {len(futures) - failed} of {len(seen)} images"))
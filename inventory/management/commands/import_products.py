@@ -0,0 +1,30 @@
+import csv
+import json
+from django.core.management.base import BaseCommand, CommandError
+from inventory.importer import ProductImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Create or update products by SKU from a CSV (with header) or JSON lines file, streamed in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension, else csv")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--no-create-groups", action="store_true", help="Reject rows with unknown categories or brands")
+        parser.add_argument("--errors", type=int, default=50, help="How many row errors to print")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or detect_format(options["path"])
+        importer = ProductImporter(chunk_size=options["chunk_size"], create_groups=not options["no_create_groups"])
+        try:
+            with open(options["path"], "rb") as stream:
+                summary = importer.run(read_rows(stream, fmt))
+        except (OSError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(f"{exc} (after {importer.created} created, {importer.updated} updated)")
+
+        for error in summary["errors"][:options["errors"]]:
+            self.stdout.write(self.style.WARNING(json.dumps(error)))
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['created']} created, {summary['updated']} updated, {summary['failed']} failed"
+        ))
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from inventory.typeahead import TypeaheadIndex
+
+
+class Command(BaseCommand):
+    help = "Build the product typeahead index and report its size, memory footprint and lookup latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("queries", nargs="*", default=["a", "mi", "choc", "1"])
+        parser.add_argument("--repeat", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        index = TypeaheadIndex()
+        started = time.perf_counter()
+        index.data()
+        self.stdout.write(f"Built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        for key, value in index.memory_usage().items():
+            self.stdout.write(f"{key:>12}: {value:,}")
+
+        for query in options["queries"]:
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                results = index.search(query)
+            elapsed = (time.perf_counter() - started) / options["repeat"] * 1_000_000
+            self.stdout.write(f"{query!r:>12}: {len(results)} results in {elapsed:.1f} µs")
@@ -0,0 +1,14 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from inventory.models import ProductTombstone
+
+
+class Command(BaseCommand):
+    help = "Delete product tombstones older than CATALOG_TOMBSTONE_DAYS (terminals that far behind get a full snapshot)."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.CATALOG_TOMBSTONE_DAYS)
+        deleted, _ = ProductTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} product tombstones"))
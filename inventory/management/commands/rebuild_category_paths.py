@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from inventory.models import Category
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized path and depth of every category from its parent links."
+
+    def handle(self, *args, **options):
+        count = Category.rebuild_paths()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt paths for {count} categories"))
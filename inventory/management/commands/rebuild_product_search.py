@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from inventory.search import get_backend, rebuild
+
+
+class Command(BaseCommand):
+    help = "Create and refill the product full-text search index (SQLite FTS5 / PostgreSQL tsvector + pg_trgm)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            self.stdout.write(self.style.WARNING("This database has no search index backend; icontains search stays in use"))
+            return
+
+        count = rebuild(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products into {backend.table}"))
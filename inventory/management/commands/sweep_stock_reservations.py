@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from inventory.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired cart stock holds (they are already ignored once expired)."
+
+    def handle(self, *args, **options):
+        deleted = sweep_expired(force=True)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired holds"))
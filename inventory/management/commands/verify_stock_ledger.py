@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from accounts.models import Branch
+from inventory.ledger import verify_branch
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every stock from the StockMovement ledger and report (or, with --repair, fix) "
+        "Stock rows that disagree. Branches are checked in parallel worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--branch", type=int, action="append", dest="branches", help="Branch id; repeat for several (default: all)")
+        parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1), help="Worker processes (0 = run in this process)")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--limit", type=int, default=100, help="How many drifted stocks to print per branch")
+        parser.add_argument("--repair", action="store_true", help="Overwrite drifted stocks with the ledger totals")
+
+    def handle(self, *args, **options):
+        branches = dict(Branch.objects.order_by("pk").values_list("pk", "name"))
+        if options["branches"]:
+            unknown = set(options["branches"]) - set(branches)
+            if unknown:
+                raise CommandError(f"Unknown branch ids: {', '.join(map(str, sorted(unknown)))}")
+            branches = {pk: branches[pk] for pk in options["branches"]}
+
+        arguments = (options["repair"], options["chunk_size"], options["limit"])
+        workers = min(options["workers"], len(branches))
+        if workers:
+            # spawn: every worker sets Django up and opens its own connection
+            connections.close_all()
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup) as pool:
+                futures = [pool.submit(verify_branch, branch_id, *arguments) for branch_id in branches]
+                summaries = [future.result() for future in as_completed(futures)]
+        else:
+            summaries = [verify_branch(branch_id, *arguments) for branch_id in branches]
+
+        checked = drifted = repaired = 0
+        for summary in sorted(summaries, key=lambda summary: summary["branch_id"]):
+            name = branches[summary["branch_id"]]
+            for drift in summary["drifts"]:
+                status = "repaired" if drift["repaired"] else "drift"
+                self.stdout.write(self.style.WARNING(
+                    f"{name}: {drift['sku'] or drift['product_id']} stock {drift['on_hand']} "
+                    f"ledger {drift['expected']} ({drift['expected'] - drift['on_hand']:+}) {status}"
+                ))
+            self.stdout.write(f"{name}: {summary['checked']} stocks checked, {summary['drifted']} drifted, {summary['repaired']} repaired")
+            checked += summary["checked"]
+            drifted += summary["drifted"]
+            repaired += summary["repaired"]
+
+        style = self.style.SUCCESS if drifted == repaired else self.style.ERROR
+        self.stdout.write(style(f"{checked} stocks checked, {drifted} drifted, {repaired} repaired"))
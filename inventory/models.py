@@ -1,11 +1,21 @@
-from django.db import models
-from services.uploads import product_image_upload_path, logo_upload_path
+from django.db import models, transaction
+from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
+from services.uploads import image_storage, product_image_upload_path, logo_upload_path
 from services.validations import image_validation
+from services.stamps import next_version
 from django.core.validators import MinValueValidator
 from django.urls import reverse_lazy
 from django.conf import settings
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 from decimal import Decimal
 
+class CategoryQuerySet(models.QuerySet):
+    def subtree(self, category):
+        """category and all of its descendants, as one prefix scan of the indexed path."""
+        return self.filter(path__startswith=category.path)
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     parent = models.ForeignKey(
@@ -16,22 +26,132 @@ class Category(models.Model):
         on_delete=models.PROTECT
     )
     is_active = models.BooleanField(default=True)
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+    # Materialized path of ids from the root, e.g. "3/7/12/"; kept up to date by save().
+    # On PostgreSQL db_index also adds a varchar_pattern_ops index, which serves
+    # path__startswith under any collation.
+    path = models.CharField(max_length=255, default="", editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Categories"
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.pk and self.parent_id and (
+            self.parent_id == self.pk or f"/{self.pk}/" in f"/{self.parent.path}"
+        ):
+            raise ValidationError({'parent': 'A category cannot be placed under itself or one of its subcategories.'})
+
+    def tree_position(self):
+        parent_path = ""
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list("path", flat=True).get()
+            if not parent_path:
+                Category.rebuild_paths()
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list("path", flat=True).get()
+            if f"/{self.pk}/" in f"/{parent_path}":
+                raise ValueError("A category cannot be placed under itself or one of its subcategories.")
+        path = f"{parent_path}{self.pk}/"
+        return path, path.count("/") - 1
+
+    def save(self, *args, **kwargs):
+        self.version = next_version(self.version)
+        if kwargs.get("update_fields"):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version", "path", "depth"}
+
+        with transaction.atomic():
+            if self.pk is None:
+                super().save(*args, **kwargs)
+                self.path, self.depth = self.tree_position()
+                Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+                return
+
+            old_path, old_depth = Category.objects.filter(pk=self.pk).values_list("path", "depth").first() or ("", 0)
+            self.path, self.depth = self.tree_position()
+            super().save(*args, **kwargs)
+            if old_path and old_path != self.path:
+                # Moved: re-root every descendant in one UPDATE
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr("path", len(old_path) + 1)),
+                    depth=F("depth") + (self.depth - old_depth),
+                )
+
+    @classmethod
+    def rebuild_paths(cls):
+        """Recompute every path and depth from the parent links (for rows saved before paths existed)."""
+        parents = dict(cls.objects.values_list("id", "parent_id"))
+        paths = {}
+
+        def path_of(category_id, seen=()):
+            if category_id not in paths:
+                parent_id = parents[category_id]
+                if parent_id is None or parent_id in seen:
+                    paths[category_id] = f"{category_id}/"
+                else:
+                    paths[category_id] = path_of(parent_id, (*seen, category_id)) + f"{category_id}/"
+            return paths[category_id]
+
+        categories = [cls(pk=category_id, path=path_of(category_id)) for category_id in parents]
+        for category in categories:
+            category.depth = category.path.count("/") - 1
+        cls.objects.bulk_update(categories, ["path", "depth"], batch_size=500)
+        return len(categories)
+
+    def ancestor_ids(self):
+        return [int(part) for part in self.path.split("/")[:-2]]
+
+    def ancestors(self):
+        """Root-first ancestors, fetched with one query."""
+        return list(Category.objects.filter(pk__in=self.ancestor_ids()).order_by("depth"))
+
+    @cached_property
+    def breadcrumb(self):
+        return " / ".join([category.name for category in self.ancestors()] + [self.name])
+
+    @staticmethod
+    def attach_breadcrumbs(categories):
+        """Fill .breadcrumb for a list of categories with one query for all their ancestors."""
+        ids = {int(part) for category in categories for part in category.path.split("/") if part}
+        names = dict(Category.objects.filter(pk__in=ids).values_list("id", "name"))
+        for category in categories:
+            category.breadcrumb = " / ".join(
+                [names.get(ancestor_id, "?") for ancestor_id in category.ancestor_ids()] + [category.name]
+            )
+        return categories
+
+    @staticmethod
+    def subtree_q(category, field="category"):
+        """Q for rows whose <field> is category (an instance or id) or one of its descendants."""
+        if isinstance(category, Category):
+            path = category.path
+        else:
+            path = Category.objects.filter(pk=category).values_list("path", flat=True).first()
+        if not path:
+            return Q(pk__in=[])
+        return Q(**{f"{field}__path__startswith": path})
+
 class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
-    logo = models.ImageField(upload_to=logo_upload_path, validators=[image_validation], blank=True, null=True)
+    logo = models.ImageField(upload_to=logo_upload_path, storage=image_storage, validators=[image_validation], blank=True, null=True)
+    logo_thumbnailed = models.CharField(max_length=100, blank=True, default="", editable=False)
     is_active = models.BooleanField(default=True)
+    version = models.PositiveBigIntegerField(default=0, editable=False)
     
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        self.version = next_version(self.version)
+        if kwargs.get("update_fields"):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
     
     class Meta:
         ordering = ['name']
@@ -61,7 +181,9 @@ class Product(models.Model):
     tax_rate = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))], help_text='percentage (e.g. 5.00)')
     
     unit = models.CharField(max_length=10, choices=UNIT_CHOICES, default='pcs')
-    image = models.ImageField(upload_to=product_image_upload_path, validators=[image_validation], null=True, blank=True)
+    image = models.ImageField(upload_to=product_image_upload_path, storage=image_storage, validators=[image_validation], null=True, blank=True)
+    # Image name whose thumbnails are stored; set by services.thumbnails when they are ready
+    image_thumbnailed = models.CharField(max_length=100, blank=True, default="", editable=False)
     is_active = models.BooleanField(default=True)
     is_stockable = models.BooleanField(default=True)
 
@@ -76,6 +198,11 @@ class Product(models.Model):
     def tax_amount(self):
         return (self.base_price * self.tax_rate) / Decimal("100")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='product_updated_at_idx'),
+        ]
+
     @property
     def final_price(self):
         return self.base_price + self.tax_amount
@@ -83,16 +210,73 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
+class ProductTombstone(models.Model):
+    """Deleted product ids, kept so POS terminals syncing a catalog delta can drop them."""
+    product_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.product_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+class StockQuerySet(models.QuerySet):
+    def with_on_hand(self):
+        shard_total = (
+            StockShard.objects
+            .filter(stock=OuterRef('pk'))
+            .values('stock')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        return self.annotate(
+            shard_total=Coalesce(
+                Subquery(shard_total),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
 class Stock(models.Model):
     product = models.ForeignKey(Product,on_delete=models.PROTECT,related_name="stocks")
     branch = models.ForeignKey("accounts.Branch",on_delete=models.PROTECT,related_name="stocks")
     quantity = models.DecimalField(max_digits=10,decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
     reorder_level = models.DecimalField(max_digits=10,decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
+    shard_count = models.PositiveSmallIntegerField(default=0, help_text='split a hot stock row over N sub-counters (0 = off)')
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = StockQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'branch'], name='unique_stock_product_branch'),
+        ]
+
     def __str__(self):
         return f"{self.product} - {self.branch}"
 
+    @property
+    def on_hand(self):
+        """Coherent total: the base quantity plus whatever sits in the shards."""
+        if not self.shard_count:
+            return self.quantity
+
+        shard_total = self.__dict__.get('shard_total')
+        if shard_total is None:
+            shard_total = self.shards.aggregate(total=Sum('quantity'))['total'] or Decimal('0.00')
+        return (self.quantity + shard_total).quantize(Decimal('0.01'))
+
+class StockShard(models.Model):
+    stock = models.ForeignKey(Stock,on_delete=models.CASCADE,related_name="shards")
+    index = models.PositiveSmallIntegerField()
+    quantity = models.DecimalField(max_digits=10,decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'index'], name='unique_stock_shard_index'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock} #{self.index}"
+
 class StockMovement(models.Model):
     IN = "IN"
     OUT = "OUT"
@@ -114,5 +298,29 @@ class StockMovement(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['branch', 'product'], name='movement_branch_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movement_type} - {self.product}"
+
+
+class StockReservation(models.Model):
+    product = models.ForeignKey(Product,on_delete=models.CASCADE,related_name="reservations")
+    branch = models.ForeignKey("accounts.Branch",on_delete=models.CASCADE,related_name="reservations")
+    holder = models.CharField(max_length=64, help_text='cart / terminal key holding the stock')
+    quantity = models.DecimalField(max_digits=10,decimal_places=2, validators=[MinValueValidator(Decimal('0.00'))])
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'branch', 'holder'], name='unique_stock_reservation'),
+        ]
+        indexes = [
+            models.Index(fields=['branch', 'product', 'expires_at']),
+        ]
+
     def __str__(self):
-        return f"{self.movement_type} - {self.product}"
\ No newline at end of file
+        return f"{self.holder}: {self.product} x {self.quantity}"
@@ -0,0 +1,134 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from inventory.models import Stock, StockReservation
+
+_last_sweep = 0.0
+
+
+def sweep_expired(force=False):
+    """Delete expired holds; runs at most once per STOCK_RESERVATION_SWEEP_INTERVAL per process."""
+    global _last_sweep
+
+    if not force and time.monotonic() - _last_sweep < settings.STOCK_RESERVATION_SWEEP_INTERVAL:
+        return 0
+
+    _last_sweep = time.monotonic()
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def active_holds(branch_id, product_ids, exclude_holder=None):
+    holds = StockReservation.objects.filter(
+        branch_id=branch_id,
+        product_id__in=product_ids,
+        expires_at__gt=timezone.now(),
+    )
+    if exclude_holder:
+        holds = holds.exclude(holder=exclude_holder)
+
+    return dict(holds.values_list("product_id").annotate(total=Sum("quantity")))
+
+
+def available_to_sell(branch_id, product_ids, exclude_holder=None):
+    """On-hand stock minus other carts' live holds, read without taking any lock."""
+    product_ids = [int(product_id) for product_id in product_ids]
+    on_hand = {
+        stock.product_id: stock.on_hand
+        for stock in Stock.objects.with_on_hand().filter(branch_id=branch_id, product_id__in=product_ids)
+    }
+    held = active_holds(branch_id, product_ids, exclude_holder)
+
+    return {
+        product_id: on_hand.get(product_id, Decimal("0.00")) - (held.get(product_id) or Decimal("0.00"))
+        for product_id in product_ids
+    }
+
+
+def held_by(holder, branch_id, product_ids):
+    """{product_id: quantity} of the live holds one cart has."""
+    holds = StockReservation.objects.filter(
+        holder=holder,
+        branch_id=branch_id,
+        product_id__in=product_ids,
+        expires_at__gt=timezone.now(),
+    )
+    return dict(holds.values_list("product_id", "quantity"))
+
+
+def lock_stocks(branch_id, product_ids):
+    """
+    Lock the Stock rows the holds are taken against, in product id order, so
+    two carts cannot both read the same availability and over-reserve it.
+    Sales lock the same rows, so a hold also waits for a checkout in flight.
+    """
+    stocks = Stock.objects.select_for_update().filter(branch_id=branch_id, product_id__in=product_ids)
+    list(stocks.order_by("product_id").values_list("pk", flat=True))
+
+
+@transaction.atomic
+def hold(holder, branch_id, product_id, quantity):
+    """
+    Set the hold of one cart on a (product, branch) to quantity, refreshing its
+    expiry. Raises ValueError when other carts' holds leave too little stock;
+    shrinking a live hold always succeeds, even if stock fell below it.
+    """
+    sweep_expired()
+
+    if quantity <= 0:
+        release(holder, [product_id])
+        return
+
+    if quantity > held_by(holder, branch_id, [product_id]).get(int(product_id), Decimal("0")):
+        lock_stocks(branch_id, [product_id])
+        available = available_to_sell(branch_id, [product_id], exclude_holder=holder)[int(product_id)]
+        if quantity > available:
+            raise ValueError(f"Only {max(available, Decimal('0.00'))} available to sell")
+
+    StockReservation.objects.update_or_create(
+        holder=holder,
+        branch_id=branch_id,
+        product_id=product_id,
+        defaults={
+            "quantity": quantity,
+            "expires_at": timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL),
+        },
+    )
+
+
+@transaction.atomic
+def hold_many(holder, branch_id, quantities):
+    """
+    Set several holds of one cart at once ({product_id: quantity}) with one
+    availability read and one insert. All or nothing: raises ValueError naming
+    the first product that is short. Holds that shrink are not checked.
+    """
+    sweep_expired()
+
+    current = held_by(holder, branch_id, list(quantities))
+    growing = [product_id for product_id, quantity in quantities.items() if quantity > current.get(int(product_id), Decimal("0"))]
+    lock_stocks(branch_id, growing)
+    available = available_to_sell(branch_id, growing, exclude_holder=holder)
+    for product_id in growing:
+        quantity = quantities[product_id]
+        if quantity > available[int(product_id)]:
+            raise ValueError(f"Only {max(available[int(product_id)], Decimal('0.00'))} of product #{product_id} available to sell")
+
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    release(holder, list(quantities))
+    StockReservation.objects.bulk_create([
+        StockReservation(holder=holder, branch_id=branch_id, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+        if quantity > 0
+    ])
+
+
+def release(holder, product_ids=None):
+    holds = StockReservation.objects.filter(holder=holder)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    holds.delete()
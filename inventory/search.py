@@ -0,0 +1,209 @@
+import logging
+import re
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from inventory.models import Product
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokens(query):
+    return TOKEN_RE.findall((query or "").lower())
+
+
+def document_rows(product_ids=None):
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    return products.values_list("id", "name", "sku", "barcode", "description", "category__name", "brand__name")
+
+
+class SQLiteProductSearch:
+    """FTS5 table keyed by product id (rowid); bm25 ranking with name and codes weighted highest."""
+
+    table = "inventory_product_fts"
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            "name, sku, barcode, description, category, brand, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+    def delete(self, cursor, product_ids):
+        cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(product_id,) for product_id in product_ids])
+
+    def insert(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {self.table} (rowid, name, sku, barcode, description, category, brand) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            [tuple("" if value is None else value for value in row) for row in rows],
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, cursor, terms, limit, within=None):
+        # Every term must match, as a prefix, in any column
+        match = " ".join(f'"{term}"*' for term in terms)
+        sql, params = within or ("", ())
+        cursor.execute(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+            + (f"AND rowid IN ({sql}) " if sql else "")
+            + f"ORDER BY bm25({self.table}, 10.0, 8.0, 8.0, 1.0, 2.0, 2.0) LIMIT %s",
+            [match, *params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresProductSearch:
+    """
+    Weighted tsvector (prefix queries, ts_rank_cd) plus a pg_trgm index on the
+    name so misspelt names still rank. Needs the pg_trgm extension.
+    """
+
+    table = "inventory_product_search"
+
+    def create(self, cursor):
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "product_id integer PRIMARY KEY, name text NOT NULL, document tsvector NOT NULL)"
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_document ON {self.table} USING gin (document)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_name_trgm ON {self.table} USING gin (lower(name) gin_trgm_ops)")
+
+    def delete(self, cursor, product_ids):
+        cursor.execute(f"DELETE FROM {self.table} WHERE product_id = ANY(%s)", [list(product_ids)])
+
+    def insert(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {self.table} (product_id, name, document) VALUES (%s, %s, "
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s || ' ' || %s), 'A') || "
+            "setweight(to_tsvector('simple', %s || ' ' || %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C')) "
+            "ON CONFLICT (product_id) DO UPDATE SET name = EXCLUDED.name, document = EXCLUDED.document",
+            [
+                (product_id, name, name, sku, barcode, category or "", brand or "", description or "")
+                for product_id, name, sku, barcode, description, category, brand in rows
+            ],
+        )
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {self.table}")
+
+    def search(self, cursor, terms, limit, within=None):
+        query = " & ".join(f"{term}:*" for term in terms)
+        text = " ".join(terms)
+        sql, params = within or ("", ())
+        cursor.execute(
+            f"SELECT product_id FROM {self.table}, to_tsquery('simple', %s) query "
+            "WHERE (document @@ query OR lower(name) %% %s) "
+            + (f"AND product_id IN ({sql}) " if sql else "")
+            + "ORDER BY ts_rank_cd(document, query) + similarity(lower(name), %s) DESC LIMIT %s",
+            [query, text, *params, text, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    "sqlite": SQLiteProductSearch,
+    "postgresql": PostgresProductSearch,
+}
+
+_ready = None
+
+
+def get_backend():
+    backend = BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+
+def ensure_index(populate=True, **kwargs):
+    """
+    Create the search table if this database supports it (run after migrate).
+    A table created here is filled from the products already stored, so an
+    existing catalog is searchable right after the first migrate.
+    """
+    global _ready
+
+    backend = get_backend()
+    if backend is None:
+        return False
+
+    created = backend.table not in connection.introspection.table_names()
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            backend.create(cursor)
+    except DatabaseError as exc:
+        logger.warning("Product search index unavailable, falling back to LIKE search: %s", exc)
+        _ready = False
+        return False
+
+    _ready = True
+    if created and populate:
+        rebuild()
+    return True
+
+
+def is_ready():
+    global _ready
+
+    if _ready is None:
+        backend = get_backend()
+        _ready = backend is not None and backend.table in connection.introspection.table_names()
+    return _ready
+
+
+def index_products(product_ids):
+    """Re-index the given products; ids that no longer exist are just removed."""
+    product_ids = list(product_ids)
+    if not product_ids or not is_ready():
+        return
+
+    backend = get_backend()
+    rows = list(document_rows(product_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        backend.delete(cursor, product_ids)
+        backend.insert(cursor, rows)
+
+
+def rebuild(chunk_size=2000):
+    ensure_index(populate=False)
+    if not is_ready():
+        return 0
+
+    backend = get_backend()
+    count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        backend.clear(cursor)
+        chunk = []
+        for row in document_rows().iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                backend.insert(cursor, chunk)
+                count += len(chunk)
+                chunk = []
+        backend.insert(cursor, chunk)
+        count += len(chunk)
+    return count
+
+
+def search_products(query, limit=None, within=None):
+    """
+    Product ids matching every term of query (as prefixes), best match first,
+    or None when no search index is available and the caller should fall back.
+    within is an optional Product queryset the matches must belong to; it is
+    applied inside the search query, before the limit.
+    """
+    terms = tokens(query)
+    if not terms or not is_ready():
+        return None
+
+    if within is not None:
+        within = within.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        return get_backend().search(cursor, terms, limit or settings.PRODUCT_SEARCH_LIMIT, within)
@@ -1,7 +1,18 @@
+from decimal import Decimal
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.db.models.functions import Coalesce, NullIf
 from rest_framework import serializers
+from services.thumbnails import field_thumbnail_url, thumbnail_url
 from .models import Product
 
+IMAGE_STORAGE = Product._meta.get_field("image").storage
+
+def absolute(request, url):
+    return request.build_absolute_uri(url) if request and url else url
+
 class ProductSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
         fields = [
@@ -16,6 +27,7 @@ class ProductSerializer(serializers.ModelSerializer):
             "tax_rate",
             "unit",
             "image",
+            "thumbnail",
             "is_active",
             "is_stockable",
             "created_at",
@@ -25,4 +37,49 @@ class ProductSerializer(serializers.ModelSerializer):
             "base_price",
             "tax_amount",
             "final_price",
-        ]
\ No newline at end of file
+        ]
+
+    def get_thumbnail(self, product):
+        return absolute(self.context.get("request"), field_thumbnail_url(product.image))
+
+class ProductRowSerializer(serializers.BaseSerializer):
+    """
+    Read-only fast path producing the same JSON as ProductSerializer, built
+    from values() rows whose prices were computed in the query (see rows())
+    instead of per-object Decimal properties and per-field DRF dispatch.
+    """
+    datetime_field = serializers.DateTimeField()
+    decimal_fields = ("cost_price", "selling_price", "discount_price", "tax_rate")
+    output_fields = [
+        "id", "name", "sku", "barcode", "description", "cost_price", "selling_price", "discount_price",
+        "tax_rate", "unit", "image", "thumbnail", "is_active", "is_stockable", "created_at", "updated_at", "category", "brand",
+    ]
+    value_fields = [field for field in output_fields if field != "thumbnail"]
+
+    @classmethod
+    def rows(cls, queryset):
+        base_price = Coalesce(NullIf(F("discount_price"), 0), F("selling_price"))
+        money = DecimalField(max_digits=20, decimal_places=10)
+        return queryset.annotate(
+            row_base_price=ExpressionWrapper(base_price, output_field=money),
+            # Not "/ 100": SQLite stores whole-number decimals as integers and would divide them as integers
+            row_tax_amount=ExpressionWrapper(base_price * F("tax_rate") * Decimal("0.01"), output_field=money),
+        ).values(*cls.value_fields, "image_thumbnailed", "row_base_price", "row_tax_amount")
+
+    def to_representation(self, row):
+        data = {field: row.get(field) for field in self.output_fields}
+        for field in self.decimal_fields:
+            if data[field] is not None:
+                data[field] = str(data[field])
+
+        data["created_at"] = self.datetime_field.to_representation(data["created_at"])
+        data["updated_at"] = self.datetime_field.to_representation(data["updated_at"])
+        request = self.context.get("request")
+        name = data["image"]
+        data["image"] = absolute(request, IMAGE_STORAGE.url(name)) if name else None
+        data["thumbnail"] = absolute(request, thumbnail_url(IMAGE_STORAGE, name, thumbnailed=row["image_thumbnailed"]))
+
+        data["base_price"] = row["row_base_price"]
+        data["tax_amount"] = row["row_tax_amount"]
+        data["final_price"] = row["row_base_price"] + row["row_tax_amount"]
+        return data
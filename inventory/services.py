@@ -1,27 +1,265 @@
+import random
+from decimal import Decimal, InvalidOperation, ROUND_DOWN
 from django.db import transaction
-from inventory.models import Stock, StockMovement
+from django.db.models import F, Q
+from django.utils import timezone
+from inventory.models import Product, Stock, StockMovement, StockShard
 
 @transaction.atomic
 def apply_stock_movement(movement, user):
-    
-    stock, _ = Stock.objects.select_for_update().get_or_create(
-        product=movement.product,
-        branch=movement.branch,
-        defaults={"quantity": 0, "reorder_level": 5}
+    """
+    Apply one movement with a single conditional UPDATE instead of a locked
+    read-modify-write, so the Stock row is only locked for the statement itself.
+    """
+    stocks = Stock.objects.filter(product=movement.product, branch=movement.branch)
+    quantity = movement.quantity
+
+    if movement.movement_type == StockMovement.OUT:
+        updated = stocks.filter(shard_count=0, quantity__gte=quantity).update(
+            quantity=F("quantity") - quantity, updated_at=timezone.now()
+        )
+        if not updated:
+            stock = stocks.filter(shard_count__gt=0).first()
+            if stock is None:
+                raise ValueError("Insufficient stock")
+            take_from_shards(stock, quantity)
+
+    elif movement.movement_type in (StockMovement.IN, StockMovement.ADJUSTMENT):
+        updated = stocks.filter(shard_count=0).update(quantity=F("quantity") + quantity, updated_at=timezone.now())
+        if not updated:
+            stock, created = Stock.objects.get_or_create(
+                product=movement.product,
+                branch=movement.branch,
+                defaults={"quantity": quantity, "reorder_level": 5}
+            )
+            if stock.shard_count:
+                add_to_shards(stock, quantity)
+            elif not created:
+                stocks.update(quantity=F("quantity") + quantity, updated_at=timezone.now())
+
+    movement.created_by = user
+    movement.save()
+
+def take_from_shards(stock, quantity):
+    """
+    Decrement a sharded stock without touching its Stock row: try the shards in
+    random order with a conditional UPDATE each, and only when none of them
+    holds enough fall back to a locked compaction over the whole stock.
+    """
+    indexes = list(range(stock.shard_count))
+    random.shuffle(indexes)
+
+    for index in indexes:
+        updated = StockShard.objects.filter(stock=stock, index=index, quantity__gte=quantity).update(
+            quantity=F("quantity") - quantity
+        )
+        if updated:
+            return
+
+    compact_stock(stock, delta=-quantity)
+
+def add_to_shards(stock, quantity):
+    index = random.randrange(stock.shard_count)
+    updated = StockShard.objects.filter(stock=stock, index=index).update(quantity=F("quantity") + quantity)
+    if not updated:
+        compact_stock(stock, delta=quantity)
+
+@transaction.atomic
+def compact_stock(stock, delta=Decimal("0.00"), total=None):
+    """
+    Fold the shards of a stock back into one total (plus delta, or replaced by
+    total) and spread it evenly over stock.shard_count shards again; whatever
+    does not divide evenly stays on Stock.quantity. Unsharded stocks simply end
+    up with the whole total on Stock.quantity.
+    """
+    stock = Stock.objects.select_for_update().get(pk=stock.pk)
+    shards = list(StockShard.objects.select_for_update().filter(stock=stock).order_by("index"))
+
+    if total is None:
+        total = stock.quantity + sum((shard.quantity for shard in shards), Decimal("0.00"))
+    total += delta
+    if total < 0:
+        raise ValueError("Insufficient stock")
+
+    count = stock.shard_count
+    share = (total / count).quantize(Decimal("0.01"), rounding=ROUND_DOWN) if count else Decimal("0.00")
+
+    existing = {shard.index: shard for shard in shards if shard.index < count}
+    StockShard.objects.filter(stock=stock, index__gte=count).delete()
+    for shard in existing.values():
+        shard.quantity = share
+    StockShard.objects.bulk_update(existing.values(), ["quantity"])
+    StockShard.objects.bulk_create([
+        StockShard(stock=stock, index=index, quantity=share)
+        for index in range(count)
+        if index not in existing
+    ])
+
+    stock.quantity = total - share * count
+    stock.save(update_fields=["quantity", "updated_at"])
+    return stock
+
+def lock_stocks(branch, product_ids):
+    """
+    Lock the Stock rows (and their products) of one branch in a single query.
+    Rows are always locked in product id order so two tills selling the same
+    items in a different basket order cannot deadlock each other. Sharded
+    stocks are left out on purpose: their Stock row is never locked on the
+    sales path.
+    """
+    stocks = (
+        Stock.objects
+        .select_for_update(of=("self", "product"))
+        .select_related("product")
+        .filter(branch=branch, product_id__in=set(product_ids), shard_count=0)
+        .order_by("product_id")
+    )
+    return {stock.product_id: stock for stock in stocks}
+
+def sharded_stocks(branch, product_ids):
+    stocks = (
+        Stock.objects
+        .select_related("product")
+        .filter(branch=branch, product_id__in=set(product_ids), shard_count__gt=0)
     )
+    return {stock.product_id: stock for stock in stocks}
 
-    if movement.movement_type == StockMovement.IN:
-        stock.quantity += movement.quantity
+def apply_sharded_movement(stock, movement):
+    if movement.movement_type == StockMovement.OUT:
+        try:
+            take_from_shards(stock, movement.quantity)
+        except ValueError:
+            raise ValueError(f"Insufficient stock for product {stock.product.name} at branch {movement.branch.name}")
 
-    elif movement.movement_type == StockMovement.OUT:
-        if stock.quantity < movement.quantity:
-            raise ValueError("Insufficient stock")
-        stock.quantity -= movement.quantity
+    elif movement.movement_type in (StockMovement.IN, StockMovement.ADJUSTMENT):
+        add_to_shards(stock, movement.quantity)
 
-    elif movement.movement_type == StockMovement.ADJUSTMENT:
-        stock.quantity += movement.quantity
+@transaction.atomic
+def apply_stock_movements(movements, user):
+    """
+    Set-based counterpart of apply_stock_movement: locks every Stock row the
+    movements touch in one query per branch, then writes all movements with one
+    bulk_create and all stock quantities with one bulk_update.
+    """
+    if not movements:
+        return []
 
-    stock.save()
+    by_branch = {}
+    for movement in movements:
+        by_branch.setdefault(movement.branch_id, []).append(movement)
 
-    movement.created_by = user
-    movement.save()
\ No newline at end of file
+    now = timezone.now()
+    changed = {}
+    created = {}
+    for branch_id in sorted(by_branch):
+        branch_movements = by_branch[branch_id]
+        branch = branch_movements[0].branch
+        product_ids = [m.product_id for m in branch_movements]
+        stocks = lock_stocks(branch, product_ids)
+
+        missing = set(product_ids) - set(stocks)
+        sharded = sharded_stocks(branch, missing) if missing else {}
+
+        for movement in branch_movements:
+            if movement.product_id in sharded:
+                apply_sharded_movement(sharded[movement.product_id], movement)
+                continue
+
+            stock = stocks.get(movement.product_id)
+
+            if stock is None:
+                if movement.movement_type == StockMovement.OUT:
+                    raise ValueError(f"Insufficient stock for product {movement.product} at branch {branch.name}")
+                stock = Stock(product_id=movement.product_id, branch=branch, quantity=0, reorder_level=5)
+                stocks[movement.product_id] = stock
+                created[(movement.product_id, branch.pk)] = stock
+
+            if movement.movement_type in (StockMovement.IN, StockMovement.ADJUSTMENT):
+                stock.quantity += movement.quantity
+
+            elif movement.movement_type == StockMovement.OUT:
+                if stock.quantity < movement.quantity:
+                    raise ValueError(f"Insufficient stock for product {stock.product.name} at branch {branch.name}")
+                stock.quantity -= movement.quantity
+
+            stock.updated_at = now
+            if stock.pk:
+                changed[stock.pk] = stock
+
+        for movement in branch_movements:
+            movement.created_by = user
+
+    if created:
+        Stock.objects.bulk_create(created.values())
+    if changed:
+        Stock.objects.bulk_update(changed.values(), ["quantity", "updated_at"])
+
+    return StockMovement.objects.bulk_create(movements)
+
+def receipt_lines(items):
+    """
+    Resolve goods-receipt items ({"product": id} or {"code": barcode or SKU},
+    plus "quantity") to (product id, quantity) lines with two queries.
+    Returns the lines and a list of {"line": n, "error": ...} for the items
+    that cannot be received; line numbers start at 1.
+    """
+    parsed = []
+    errors = []
+    for number, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            errors.append({"line": number, "error": "not an object"})
+            continue
+        try:
+            quantity = Decimal(str(item.get("quantity", 1)).strip()).quantize(Decimal("0.01"))
+        except (InvalidOperation, ValueError):
+            quantity = None
+        if quantity is None or not quantity.is_finite() or quantity <= 0:
+            errors.append({"line": number, "error": "quantity must be a positive number"})
+            continue
+        if len(quantity.as_tuple().digits) > 10:
+            errors.append({"line": number, "error": "quantity is too large"})
+            continue
+        parsed.append((number, str(item.get("product") or ""), str(item.get("code") or "").strip(), quantity))
+
+    ids = {int(product) for _, product, code, _ in parsed if not code and product.isdigit()}
+    codes = {code for _, _, code, _ in parsed if code}
+    by_id = {}
+    by_code = {}
+    for pk, barcode, sku, stockable in (
+        Product.objects.filter(Q(pk__in=ids) | Q(barcode__in=codes) | Q(sku__in=codes))
+        .values_list("pk", "barcode", "sku", "is_stockable")
+    ):
+        by_id[str(pk)] = by_code[barcode] = (pk, stockable)
+        by_code.setdefault(sku, (pk, stockable))
+
+    lines = []
+    for number, product, code, quantity in parsed:
+        key = code or product
+        found = by_code.get(code) if code else by_id.get(product)
+        if found is None:
+            errors.append({"line": number, "error": f"unknown product '{key}'"})
+        elif not found[1]:
+            errors.append({"line": number, "error": f"product '{key}' is not stockable"})
+        else:
+            lines.append((found[0], quantity))
+
+    errors.sort(key=lambda error: error["line"])
+    return lines, errors
+
+def receive_stock(branch, lines, user, reference=""):
+    """
+    Book a delivery: one IN movement per (product id, quantity) line, all
+    applied in one transaction through apply_stock_movements, so the branch's
+    Stock rows are locked with one query and each stock gets its whole
+    received quantity in the same set-based update however many lines name it.
+    """
+    return apply_stock_movements([
+        StockMovement(
+            product_id=product_id,
+            branch=branch,
+            movement_type=StockMovement.IN,
+            quantity=quantity,
+            reference=reference,
+        )
+        for product_id, quantity in lines
+    ], user)
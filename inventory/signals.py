@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from inventory.models import Brand, Category, Product, ProductTombstone
+from inventory.lookup import product_lookup
+from inventory.typeahead import product_typeahead
+from inventory.search import index_products
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: product_lookup.update(instance))
+    transaction.on_commit(lambda: product_typeahead.update(instance))
+    transaction.on_commit(lambda: index_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    product_id = instance.pk
+    # Same transaction as the delete, so the catalog delta feed never misses it
+    ProductTombstone.objects.create(product_id=product_id)
+    transaction.on_commit(lambda: product_lookup.remove(product_id))
+    transaction.on_commit(lambda: product_typeahead.remove(product_id))
+    transaction.on_commit(lambda: index_products([product_id]))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def product_group_saved(sender, instance, **kwargs):
+    # Category and brand names are part of every product's search document
+    transaction.on_commit(lambda: index_products(instance.products.values_list("id", flat=True)))
+
+
+@receiver(pre_delete, sender=Brand)
+def brand_deleting(sender, instance, **kwargs):
+    # Products lose the brand (SET_NULL) before post_delete, so collect them now
+    product_ids = list(instance.products.values_list("id", flat=True))
+    transaction.on_commit(lambda: index_products(product_ids))
@@ -1,3 +1,240 @@
-from django.test import TestCase
+import io
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import Branch
+from inventory.importer import ProductImporter, read_rows
+from inventory.models import Brand, Category, Product, Stock, StockMovement
+from inventory.lookup import ProductLookup
+from inventory.reservations import available_to_sell, hold, hold_many
+from inventory.services import apply_stock_movement, apply_stock_movements, compact_stock
+from inventory.typeahead import TypeaheadIndex
 
-# Create your tests here.
+
+class ProductListConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username="cashier", password="secret")
+        self.client.force_login(self.user)
+        self.url = reverse("inventory:api-products")
+        self.category = Category.objects.create(name="Dairy")
+        self.add_product("Milk", "1001")
+
+    def add_product(self, name, code):
+        return Product.objects.create(
+            name=name, sku=code, barcode=code, category=self.category,
+            cost_price="1.00", selling_price="2.00", tax_rate="5.00",
+        )
+
+    def test_unchanged_list_returns_304_with_only_the_stamp_lookups(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.has_header("ETag"))
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 304)
+        # Newest change and newest tombstone; no COUNT over the product table
+        product_queries = [query["sql"] for query in queries if "inventory_product" in query["sql"]]
+        self.assertEqual(len(product_queries), 2)
+        self.assertTrue(all("MAX(" in sql and "COUNT(" not in sql for sql in product_queries))
+
+    def test_write_through_a_queryset_changes_the_etag(self):
+        # What another worker's save looks like from here: no signal, no on_commit hook
+        first = self.client.get(self.url)
+        Product.objects.filter(sku="1001").update(name="Whole milk", updated_at=timezone.now())
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+
+    def test_deleting_a_product_changes_the_etag(self):
+        self.add_product("Bread", "1002")
+        first = self.client.get(self.url)
+        Product.objects.filter(sku="1001").delete()
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+
+    def test_saving_a_product_changes_the_etag(self):
+        first = self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_product("Bread", "1002")
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+
+
+class StockMovementTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="keeper", password="secret", phone="100")
+        self.branch = Branch.objects.create(name="Main", code="MAIN", address="-")
+        category = Category.objects.create(name="Dairy")
+        self.milk, self.bread = (
+            Product.objects.create(
+                name=name, sku=code, barcode=code, category=category,
+                cost_price="1.00", selling_price="2.00", tax_rate="5.00",
+            )
+            for name, code in (("Milk", "1001"), ("Bread", "1002"))
+        )
+
+    def movement(self, product, movement_type, quantity):
+        return StockMovement(product=product, branch=self.branch, movement_type=movement_type, quantity=Decimal(quantity))
+
+    def on_hand(self, product):
+        return Stock.objects.get(product=product, branch=self.branch).on_hand
+
+    def test_out_decrements_stock(self):
+        Stock.objects.create(product=self.milk, branch=self.branch, quantity=5, reorder_level=1)
+        apply_stock_movement(self.movement(self.milk, StockMovement.OUT, "2"), self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("3.00"))
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_out_rejects_oversell_without_writing(self):
+        Stock.objects.create(product=self.milk, branch=self.branch, quantity=1, reorder_level=1)
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            apply_stock_movement(self.movement(self.milk, StockMovement.OUT, "2"), self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("1.00"))
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_out_without_stock_row_is_rejected(self):
+        with self.assertRaises(ValueError):
+            apply_stock_movement(self.movement(self.milk, StockMovement.OUT, "1"), self.user)
+        self.assertFalse(Stock.objects.exists())
+
+    def test_in_creates_missing_stock_row(self):
+        apply_stock_movement(self.movement(self.milk, StockMovement.IN, "4"), self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("4.00"))
+
+        apply_stock_movement(self.movement(self.milk, StockMovement.ADJUSTMENT, "1.5"), self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("5.50"))
+        self.assertEqual(Stock.objects.count(), 1)
+
+    def test_sharded_stock_takes_and_adds_through_shards(self):
+        stock = Stock.objects.create(product=self.milk, branch=self.branch, quantity=0, reorder_level=1, shard_count=3)
+        compact_stock(stock, total=Decimal("9"))
+
+        apply_stock_movement(self.movement(self.milk, StockMovement.OUT, "2"), self.user)
+        apply_stock_movement(self.movement(self.milk, StockMovement.IN, "1"), self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("8.00"))
+
+        # More than any single shard holds: falls back to compaction
+        apply_stock_movement(self.movement(self.milk, StockMovement.OUT, "7"), self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("1.00"))
+        with self.assertRaises(ValueError):
+            apply_stock_movement(self.movement(self.milk, StockMovement.OUT, "2"), self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("1.00"))
+
+    def test_batch_oversell_rolls_back_every_line(self):
+        Stock.objects.create(product=self.milk, branch=self.branch, quantity=5, reorder_level=1)
+        Stock.objects.create(product=self.bread, branch=self.branch, quantity=1, reorder_level=1)
+        with self.assertRaises(ValueError):
+            apply_stock_movements([
+                self.movement(self.milk, StockMovement.OUT, "2"),
+                self.movement(self.bread, StockMovement.OUT, "2"),
+            ], self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("5.00"))
+        self.assertEqual(self.on_hand(self.bread), Decimal("1.00"))
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_batch_sums_repeated_lines_and_creates_missing_rows(self):
+        Stock.objects.create(product=self.milk, branch=self.branch, quantity=5, reorder_level=1)
+        apply_stock_movements([
+            self.movement(self.milk, StockMovement.OUT, "2"),
+            self.movement(self.milk, StockMovement.OUT, "1"),
+            self.movement(self.bread, StockMovement.IN, "3"),
+        ], self.user)
+        self.assertEqual(self.on_hand(self.milk), Decimal("2.00"))
+        self.assertEqual(self.on_hand(self.bread), Decimal("3.00"))
+        self.assertEqual(StockMovement.objects.filter(created_by=self.user).count(), 3)
+
+
+class CategorySubtreeTests(TestCase):
+    def test_subtree_matches_whole_path_segments(self):
+        categories = [Category.objects.create(name=str(number)) for number in range(12)]
+        child = Category.objects.create(name="Child", parent=categories[1])
+        grandchild = Category.objects.create(name="Grandchild", parent=child)
+
+        # categories[1] must not pull in siblings whose id merely starts with the same digit
+        subtree = Category.objects.subtree(categories[1])
+        self.assertEqual(set(subtree), {categories[1], child, grandchild})
+        self.assertEqual(
+            set(Category.objects.filter(Category.subtree_q(child.pk, "parent"))), {grandchild}
+        )
+
+
+class ProductImporterTests(TestCase):
+    def test_groups_are_created_only_for_saved_rows(self):
+        data = (
+            b"sku,barcode,name,category,brand,cost_price,selling_price,tax_rate\n"
+            b"A1,111,Milk,Dairy,Farm,1,2,0\n"
+            b"A2,222,Bread,Bakery,Oven,abc,2,0\n"
+        )
+        summary = ProductImporter().run(read_rows(io.BytesIO(data)))
+
+        self.assertEqual((summary["created"], summary["failed"]), (1, 1))
+        self.assertEqual(list(Category.objects.values_list("name", flat=True)), ["Dairy"])
+        self.assertEqual(list(Brand.objects.values_list("name", flat=True)), ["Farm"])
+        self.assertEqual(Product.objects.get(sku="A1").category.name, "Dairy")
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Main", code="MAIN", address="-")
+        category = Category.objects.create(name="Dairy")
+        self.milk = Product.objects.create(
+            name="Milk", sku="1001", barcode="1001", category=category,
+            cost_price="1.00", selling_price="2.00", tax_rate="5.00",
+        )
+        Stock.objects.create(product=self.milk, branch=self.branch, quantity=5, reorder_level=1)
+
+    def test_holds_cannot_exceed_stock(self):
+        hold("till-1", self.branch.pk, self.milk.pk, Decimal("3"))
+        with self.assertRaisesMessage(ValueError, "Only 2"):
+            hold("till-2", self.branch.pk, self.milk.pk, Decimal("3"))
+
+        hold("till-1", self.branch.pk, self.milk.pk, Decimal("1"))
+        hold("till-2", self.branch.pk, self.milk.pk, Decimal("3"))
+        self.assertEqual(available_to_sell(self.branch.pk, [self.milk.pk])[self.milk.pk], Decimal("1.00"))
+
+    def test_shrinking_a_hold_succeeds_when_stock_fell_below_it(self):
+        hold("till-1", self.branch.pk, self.milk.pk, Decimal("4"))
+        Stock.objects.filter(product=self.milk, branch=self.branch).update(quantity=2)
+
+        hold("till-1", self.branch.pk, self.milk.pk, Decimal("3"))
+        hold_many("till-1", self.branch.pk, {str(self.milk.pk): Decimal("2.5")})
+        with self.assertRaisesMessage(ValueError, "Only 2"):
+            hold("till-1", self.branch.pk, self.milk.pk, Decimal("3"))
+
+
+@override_settings(PRODUCT_LOOKUP_CHECK_INTERVAL=0)
+class ProductIndexTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Dairy")
+        self.milk, self.bread = (
+            Product.objects.create(
+                name=name, sku=code, barcode=code, category=category,
+                cost_price="1.00", selling_price="2.00", tax_rate="5.00",
+            )
+            for name, code in (("Milk", "1001"), ("Bread", "1002"))
+        )
+
+    def test_indexes_pick_up_changes_made_by_other_workers(self):
+        lookup, typeahead = ProductLookup(), TypeaheadIndex()
+        self.assertEqual(lookup.get("1001").base_price, Decimal("2.00"))
+        self.assertEqual([entry.name for entry in typeahead.search("milk")], ["Milk"])
+
+        # No signal reaches these instances, as for a save in another process
+        Product.objects.filter(pk=self.milk.pk).update(name="Oat milk", selling_price="3.00", updated_at=timezone.now())
+        Product.objects.filter(pk=self.bread.pk).delete()
+
+        self.assertEqual(lookup.get("1001").base_price, Decimal("3.00"))
+        self.assertIsNone(lookup.get("1002"))
+        self.assertEqual([entry.name for entry in typeahead.search("oat")], ["Oat milk"])
+        self.assertEqual(typeahead.search("bread"), [])
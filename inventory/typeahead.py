@@ -0,0 +1,115 @@
+import sys
+from bisect import bisect_left
+from django.conf import settings
+from inventory.lookup import VersionedProductIndex, product_entries
+
+
+class TypeaheadIndex(VersionedProductIndex):
+    """
+    Prefix index over the names, name words, SKUs and barcodes of the active
+    products: one sorted list of keys with a parallel list of product ids,
+    searched with bisect. Keys are lower-cased and cut to
+    TYPEAHEAD_KEY_LENGTH characters and at most TYPEAHEAD_WORDS words of a
+    name are indexed, which bounds the memory per product. Other workers'
+    edits are pulled from the database like the barcode index's.
+    """
+
+    def keys_for(self, entry):
+        length = settings.TYPEAHEAD_KEY_LENGTH
+        name = entry.name.lower()
+        keys = {name[:length], entry.sku.lower()[:length], entry.barcode.lower()[:length]}
+        keys.update(word[:length] for word in name.split()[:settings.TYPEAHEAD_WORDS])
+        keys.discard("")
+        return keys
+
+    def build(self):
+        pairs = []
+        entries = {}
+        for entry in product_entries():
+            entries[entry.id] = entry
+            pairs.extend((key, entry.id) for key in self.keys_for(entry))
+
+        pairs.sort()
+        return {
+            "keys": [key for key, _ in pairs],
+            "ids": [product_id for _, product_id in pairs],
+            "entries": entries,
+        }
+
+    def add(self, data, entry):
+        data["entries"][entry.id] = entry
+        for key in self.keys_for(entry):
+            position = bisect_left(data["keys"], key)
+            data["keys"].insert(position, key)
+            data["ids"].insert(position, entry.id)
+
+    def discard(self, data, product_id):
+        entry = data["entries"].pop(product_id, None)
+        if entry is None:
+            return
+
+        for key in self.keys_for(entry):
+            position = bisect_left(data["keys"], key)
+            while position < len(data["keys"]) and data["keys"][position] == key:
+                if data["ids"][position] == product_id:
+                    del data["keys"][position]
+                    del data["ids"][position]
+                    break
+                position += 1
+
+    def search(self, query, limit=10):
+        """
+        Up to limit entries whose name, a name word, SKU or barcode starts with
+        the first word of query (and whose name contains every other word).
+        Whole-name and code prefixes rank before word matches, then by name.
+        """
+        words = (query or "").lower().split()
+        if not words:
+            return []
+
+        data = self.data()
+        keys, ids, entries = data["keys"], data["ids"], data["entries"]
+        prefix = words[0][:settings.TYPEAHEAD_KEY_LENGTH]
+        rest = words[1:]
+
+        found = {}
+        position = bisect_left(keys, prefix)
+        # Look a little past limit so better-ranked matches further down still win
+        while position < len(keys) and keys[position].startswith(prefix) and len(found) < limit * 5:
+            product_id = ids[position]
+            position += 1
+            if product_id in found:
+                continue
+
+            entry = entries[product_id]
+            name = entry.name.lower()
+            if rest and not all(word in name for word in rest):
+                continue
+
+            starts = name.startswith(prefix) or entry.sku.lower().startswith(prefix) or entry.barcode.lower().startswith(prefix)
+            found[product_id] = (0 if starts else 1, name)
+
+        ranked = sorted(found, key=found.get)[:limit]
+        return [entries[product_id] for product_id in ranked]
+
+    def memory_usage(self):
+        """Approximate bytes held by the index (lists, key strings, entries)."""
+        data = self.data()
+        keys, ids, entries = data["keys"], data["ids"], data["entries"]
+        key_bytes = sys.getsizeof(keys) + sum(sys.getsizeof(key) for key in set(keys))
+        id_bytes = sys.getsizeof(ids)
+        entry_bytes = sys.getsizeof(entries) + sum(
+            sys.getsizeof(entry) + sum(sys.getsizeof(value) for value in entry)
+            for entry in entries.values()
+        )
+        return {
+            "products": len(entries),
+            "keys": len(keys),
+            "key_bytes": key_bytes,
+            "id_bytes": id_bytes,
+            "entry_bytes": entry_bytes,
+            "total_bytes": key_bytes + id_bytes + entry_bytes,
+        }
+
+
+product_typeahead = TypeaheadIndex()
@@ -19,15 +19,23 @@ urlpatterns = [
     path('product/add/', views.ProductAdd.as_view(), name='product-add'),
     path('product/<int:pk>/edit/', views.ProductUpdate.as_view(), name='product-update'),
     path('product/<int:pk>/delete/', views.ProductDelete.as_view(), name='product-delete'),
+    path('product/import/', views.product_import, name='product-import'),
+    path('product/export/', views.product_export, name='product-export'),
     path('api/products/', views.ProductListAPIView.as_view(), name='api-products'),
+    path('api/products/autocomplete/', views.product_autocomplete, name='api-product-autocomplete'),
+    path('api/catalog/', views.catalog_feed, name='api-catalog'),
+    path('api/categories/', views.category_options, name='api-categories'),
+    path('api/brands/', views.brand_options, name='api-brands'),
 
     path('stock/', views.StockList.as_view(), name='stock'),
     path('stock/add/', views.StockAdd.as_view(), name='stock-add'),
     path('stock/<int:pk>/edit/', views.StockUpdate.as_view(), name='stock-update'),
     path('stock/<int:pk>/delete/', views.StockDelete.as_view(), name='stock-delete'),
+    path('api/stock/available/', views.stock_available, name='api-stock-available'),
 
     path('movement/', views.StockMovementList.as_view(), name='movement'),
     path('movement/add/', views.StockMovementAdd.as_view(), name='movement-add'),
+    path('movement/receive/', views.stock_receive, name='movement-receive'),
     path('movement/<int:pk>/edit/', views.StockMovementUpdate.as_view(), name='movement-update'),
     path('movement/<int:pk>/delete/', views.StockMovementDelete.as_view(), name='movement-delete'),
 ]
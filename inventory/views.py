@@ -1,28 +1,264 @@
+import csv
+import json
+import re
+from decimal import Decimal
+from django.conf import settings
 from django.shortcuts import render
 from django.views.generic import CreateView, ListView, UpdateView, DeleteView
 from .models import Brand, Category, Product, Stock, StockMovement
 from .forms import BrandForm, CategoryForm, ProductForm, StockForm, StockMovementForm
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.contrib.auth.decorators import login_required, permission_required
+from django.views.decorators.http import require_POST
+from django.utils.decorators import method_decorator
 from rest_framework.generics import ListAPIView
-from rest_framework.filters import SearchFilter
-from rest_framework.pagination import PageNumberPagination
-from .serializers import ProductSerializer
-from .services import apply_stock_movement
-
-class ProductPageNumberPagination(PageNumberPagination):
-    page_size = 2
-    page_query_param = 'page'
+from rest_framework.pagination import Cursor, CursorPagination
+from .serializers import ProductRowSerializer
+from .filters import CategorySubtreeFilter, ProductSearchFilter
+from .services import apply_stock_movement, receipt_lines, receive_stock
+from accounts.models import Branch
+from .reservations import available_to_sell
+from .catalog import catalog_lines, gzip_stream
+from .importer import ProductImporter, detect_format, export_lines, read_rows
+from .typeahead import product_typeahead
+from services.stamps import conditional
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination on id: no COUNT(*) and no OFFSET, so every page costs the
+    same. A ranked search (see ProductSearchFilter) has an order a keyset
+    cannot express; it is paged by offset into its ranked id list instead,
+    which PRODUCT_SEARCH_LIMIT keeps short.
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
     max_page_size = 100
+    ordering = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ranked = getattr(view, 'search_ranked', False)
+        if not self.ranked:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        self.offset = cursor.offset if cursor else 0
+
+        results = list(queryset[self.offset:self.offset + self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.has_previous = self.offset > 0
+        return results[:self.page_size]
+
+    def get_next_link(self):
+        if not self.ranked:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=self.offset + self.page_size, reverse=False, position=None))
 
+    def get_previous_link(self):
+        if not self.ranked:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=max(self.offset - self.page_size, 0), reverse=False, position=None))
+
+@method_decorator(conditional(Product, Category, Brand, headers=('Accept',)), name='get')
 class ProductListAPIView(ListAPIView):
     queryset = Product.objects.all()
-    serializer_class = ProductSerializer
-    pagination_class = ProductPageNumberPagination
-    filter_backends = [SearchFilter]
+    serializer_class = ProductRowSerializer
+    pagination_class = ProductCursorPagination
+    filter_backends = [CategorySubtreeFilter, ProductSearchFilter]
     search_fields = ['name', 'sku', 'description', 'category__name', 'brand__name']
 
+    def get_queryset(self):
+        return ProductRowSerializer.rows(super().get_queryset())
+
+@login_required
+def stock_available(request):
+    """Available-to-sell quantities (on hand minus live cart holds) for the POS, read without locks."""
+    branch = request.GET.get('branch')
+    product_ids = [product_id for product_id in request.GET.getlist('product') if product_id.isdigit()]
+    if not branch or not branch.isdigit():
+        return JsonResponse({"error": "branch is required"}, status=400)
+
+    available = available_to_sell(int(branch), product_ids, exclude_holder=request.session.session_key)
+    return JsonResponse({"branch": int(branch), "available": {str(k): str(v) for k, v in available.items()}})
+
+@login_required
+def product_autocomplete(request):
+    """Top matches for the POS picker from the in-process typeahead index (no database query on a warm index)."""
+    limit = request.GET.get('limit', '10')
+    limit = min(int(limit), 50) if limit.isdigit() else 10
+    entries = product_typeahead.search(request.GET.get('q', ''), limit)
+
+    return JsonResponse({"results": [
+        {
+            "id": entry.id,
+            "name": entry.name,
+            "sku": entry.sku,
+            "barcode": entry.barcode,
+            "base_price": str(entry.base_price),
+            "tax_rate": str(entry.tax_rate),
+        }
+        for entry in entries
+    ]})
+
+@login_required
+@conditional(Product, headers=('Accept-Encoding',))
+def catalog_feed(request):
+    """
+    Versioned catalog for POS terminals as streamed NDJSON (gzip when accepted):
+    a full snapshot, or with ?since=<version> only what changed since then.
+    """
+    since = request.GET.get('since')
+    if since is not None and not since.isdigit():
+        return JsonResponse({"error": "since must be a catalog version"}, status=400)
+
+    lines = catalog_lines(int(since) if since else None)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = StreamingHttpResponse(gzip_stream(lines), content_type='application/x-ndjson')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+@login_required
+@conditional(Category)
+def category_options(request):
+    categories = Category.objects.filter(is_active=True).order_by('path').values('id', 'name', 'parent', 'depth', 'path')
+    return JsonResponse({"results": list(categories)})
+
+@login_required
+@conditional(Brand)
+def brand_options(request):
+    brands = Brand.objects.filter(is_active=True).values('id', 'name')
+    return JsonResponse({"results": list(brands)})
+
+@login_required
+@permission_required('inventory.add_product', raise_exception=True)
+@require_POST
+def product_import(request):
+    """
+    Create or update products by SKU from an uploaded CSV or JSON lines file,
+    processed in chunks. Files over PRODUCT_IMPORT_MAX_BYTES or
+    PRODUCT_IMPORT_MAX_ROWS are refused in favour of import_products.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({"error": "file is required"}, status=400)
+
+    fmt = request.POST.get('format') or detect_format(upload.name)
+    if fmt not in ('csv', 'jsonl'):
+        return JsonResponse({"error": "format must be csv or jsonl"}, status=400)
+
+    # Large catalogs belong to the management command, not a web request
+    too_large = upload.size > settings.PRODUCT_IMPORT_MAX_BYTES
+    if not too_large:
+        too_large = sum(chunk.count(b'\n') for chunk in upload.chunks()) > settings.PRODUCT_IMPORT_MAX_ROWS + 1
+        upload.seek(0)
+    if too_large:
+        return JsonResponse({
+            "error": f"file is larger than {settings.PRODUCT_IMPORT_MAX_ROWS} rows or "
+                     f"{settings.PRODUCT_IMPORT_MAX_BYTES // 1024 ** 2} MB; "
+                     "import it on the server with: python manage.py import_products <file>",
+        }, status=413)
+
+    importer = ProductImporter(create_groups=request.POST.get('create_groups') != '0')
+    try:
+        summary = importer.run(read_rows(upload.file, fmt))
+    except (UnicodeDecodeError, csv.Error) as exc:
+        return JsonResponse({"error": f"unreadable file: {exc}", **importer.summary()}, status=400)
+
+    if request.headers.get('HX-Request'):
+        return render(request, 'inventory/product/partials/product_import_result.html', {'summary': summary})
+    return JsonResponse(summary)
+
+@login_required
+@permission_required('inventory.view_product', raise_exception=True)
+def product_export(request):
+    """Every product streamed as CSV or JSON lines (gzip when accepted) in the layout product_import reads."""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return JsonResponse({"error": "format must be csv or jsonl"}, status=400)
+
+    lines = export_lines(fmt)
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = StreamingHttpResponse(gzip_stream(lines), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+def parse_receipt_text(text):
+    """Items from a pasted receipt: one "barcode or SKU[, quantity]" per line, split on commas, semicolons or whitespace."""
+    items = []
+    for row in text.splitlines():
+        parts = [part for part in re.split(r'[,;\s]+', row) if part]
+        if parts:
+            items.append({"code": parts[0], "quantity": parts[1] if len(parts) > 1 else 1})
+    return items
+
+@login_required
+@permission_required('inventory.add_stockmovement', raise_exception=True)
+def stock_receive(request):
+    """
+    Receive a delivery in one go: many IN lines for a branch, applied in a
+    single transaction. Takes JSON {"branch", "reference", "lines": [{"product"
+    or "code", "quantity"}]} or the receiving form; nothing is booked unless
+    every line is valid.
+    """
+    if request.method != 'POST':
+        return render(request, 'inventory/movement/partials/receive_form.html', {
+            'branches': Branch.objects.filter(is_active=True).order_by('name'),
+        })
+
+    try:
+        if request.content_type == 'application/json':
+            payload = json.loads(request.body)
+            items = payload.get('lines', [])
+        else:
+            payload = request.POST
+            items = parse_receipt_text(payload.get('lines', ''))
+        branch_id = str(payload.get('branch') or '')
+        reference = str(payload.get('reference') or '').strip()[:100]
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid receipt"}, status=400)
+
+    if not isinstance(items, list) or not items:
+        return receive_response(request, {"error": "lines are required"}, status=400)
+    branch = Branch.objects.filter(pk=branch_id).first() if branch_id.isdigit() else None
+    if branch is None:
+        return receive_response(request, {"error": "branch is required"}, status=400)
+
+    lines, errors = receipt_lines(items)
+    if errors:
+        return receive_response(request, {"error": "some lines cannot be received", "errors": errors}, status=400)
+
+    movements = receive_stock(branch, lines, request.user, reference=reference)
+    return receive_response(request, {
+        "branch": branch.pk,
+        "lines": len(movements),
+        "products": len({product_id for product_id, _ in lines}),
+        "quantity": str(sum((quantity for _, quantity in lines), Decimal("0.00"))),
+    })
+
+def receive_response(request, result, status=200):
+    if request.headers.get('HX-Request'):
+        # htmx leaves non-2xx responses unswapped, so errors come back as 200 here
+        response = render(request, 'inventory/movement/partials/receive_result.html', {'result': result})
+        if status == 200:
+            response['HX-Trigger'] = 'stockReceived'
+        return response
+    return JsonResponse(result, status=status)
+
 class BrandList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     model = Brand
     template_name = 'inventory/brand/brand_list.html'
@@ -93,8 +329,12 @@ class CategoryList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     model = Category
     template_name = 'inventory/category/category_list.html'
     form_class = CategoryForm
+    context_object_name = 'category_list'
     permission_required = ['inventory:view_category']
 
+    def get_queryset(self):
+        return Category.attach_breadcrumbs(list(Category.objects.order_by('path')))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["title"] = 'Category List'
@@ -169,9 +409,18 @@ class StockList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     form_class = StockForm
     permission_required = ['inventory:view_stock']
 
+    def get_queryset(self):
+        stocks = Stock.objects.with_on_hand().select_related('product', 'branch')
+        category = self.request.GET.get('category', '')
+        if category.isdigit():
+            stocks = stocks.filter(Category.subtree_q(int(category), 'product__category'))
+        return stocks
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["title"] = 'Stock List'
+        context["categories"] = Category.attach_breadcrumbs(list(Category.objects.order_by('path')))
+        context["category"] = self.request.GET.get('category', '')
         return context
     
 class StockAdd(HtmxFormMixin, LoginRequiredMixin, PermissionRequiredMixin, CreateView):
@@ -223,9 +472,19 @@ class StockMovementAdd(HtmxFormMixin, LoginRequiredMixin, PermissionRequiredMixi
     htmx_trigger = 'closeModal'
 
     def form_valid(self, form):
-        movement = form.save()
-        apply_stock_movement(movement=movement, user=self.request.user)
-        return super().form_valid(form)
+        # apply_stock_movement saves the movement itself, once the stock is updated
+        self.object = form.save(commit=False)
+        try:
+            apply_stock_movement(movement=self.object, user=self.request.user)
+        except ValueError as e:
+            form.add_error('quantity', str(e))
+            return self.form_invalid(form)
+
+        if self.request.headers.get("HX-Request"):
+            response = render(self.request, self.row_template, {self.context_object_name: self.object})
+            response['HX-Trigger'] = self.htmx_trigger
+            return response
+        return HttpResponseRedirect(self.get_success_url())
     
 
 class StockMovementUpdate(HtmxFormMixin, LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class PaymentsConfig(AppConfig):
     name = 'payments'
+
+    def ready(self):
+        from services.stamps import register_stamp
+
+        register_stamp(self.get_model('PaymentMethod'), 'version')
@@ -4,6 +4,7 @@ from django.core.validators import MinValueValidator
 from decimal import Decimal
 from django.utils import timezone
 from django.db.models import Sum
+from services.stamps import next_version
 
 # Create your models here.
 class PaymentMethod(models.Model):
@@ -12,10 +13,17 @@ class PaymentMethod(models.Model):
     icon = models.CharField(max_length=50, blank=True, null=True, help_text='Icon class name')
     
     is_active = models.BooleanField(default=True)
+    version = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        self.version = next_version(self.version)
+        if kwargs.get("update_fields"):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
     
     class Meta:
         ordering = ['name']
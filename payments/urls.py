@@ -18,4 +18,5 @@ urlpatterns = [
     path('payment-method/add/', views.PaymentMethodCreate.as_view(), name='payment-method-create'),
     path('payment-method/<int:pk>/edit/', views.PaymentMethodUpdate.as_view(), name='payment-method-update'),
     path('payment-method/<int:pk>/delete/', views.PaymentMethodDelete.as_view(), name='payment-method-delete'),
+    path('api/payment-methods/', views.payment_method_options, name='api-payment-methods'),
 ]
@@ -2,12 +2,20 @@ from django.shortcuts import render, redirect
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.urls import reverse_lazy
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.contrib.auth.decorators import login_required
 from .models import Payment, PaymentMethod, Refund
 from .forms import PaymentForm, PaymentMethodForm, RefundForm
 from django.db import transaction
 from django.core.exceptions import ValidationError
 import sweetify
+from services.stamps import conditional
+
+@login_required
+@conditional(PaymentMethod)
+def payment_method_options(request):
+    methods = PaymentMethod.objects.filter(is_active=True).order_by('id').values('id', 'name', 'code', 'icon')
+    return JsonResponse({"results": list(methods)})
 
 class PaymentMethodList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     model = PaymentMethod
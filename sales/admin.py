@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Sale, SaleItem
+from .models import Sale, SaleItem, NumberSequence
 
 # Register your models here.
 @admin.register(Sale)
@@ -20,4 +20,13 @@ class SaleItemAdmin(admin.ModelAdmin):
     list_display_links = ['id', 'sale']
     list_filter = ['sale']
     list_per_page = 10
-    search_fields = ['sale', 'product']
\ No newline at end of file
+    search_fields = ['sale', 'product']
+
+@admin.register(NumberSequence)
+class NumberSequenceAdmin(admin.ModelAdmin):
+    model = NumberSequence
+
+    list_display = ['id', 'name', 'branch', 'next_value']
+    list_display_links = ['id', 'name']
+    list_filter = ['name', 'branch']
+    list_per_page = 10
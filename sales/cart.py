@@ -1,10 +1,53 @@
 from decimal import Decimal, ROUND_HALF_UP
+from accounts.models import Branch
+from inventory import reservations
+from sales.cart_storage import get_cart_storage
+
+# Running aggregates kept in the cart state next to the lines
+TOTAL_KEYS = ("subtotal", "tax", "total", "quantity")
 
 
 class Cart:
     def __init__(self, request):
-        self.session = request.session
-        self.cart = self.session.get("cart", {})
+        self.storage = get_cart_storage(request)
+        self.cart, self.state = self.storage.load()
+        self.branch_id = self.state.get("branch")
+
+    @property
+    def holder(self):
+        return self.storage.key
+
+    def set_branch(self, branch_id):
+        """
+        Hold stock at this branch from now on, moving existing holds over on a
+        change. Raises ValueError for an id that is not an existing branch.
+        """
+        branch_id = str(branch_id).strip()
+        if not branch_id.isdigit():
+            raise ValueError("Invalid branch")
+        branch_id = int(branch_id)
+        if branch_id == self.branch_id:
+            return
+        if not Branch.objects.filter(pk=branch_id).exists():
+            raise ValueError("Invalid branch")
+
+        if self.branch_id:
+            reservations.release(self.holder)
+
+        self.branch_id = branch_id
+        self.state["branch"] = branch_id
+        self.storage.save_state(self.state)
+
+        for product_id, item in self.cart.items():
+            try:
+                reservations.hold(self.holder, branch_id, product_id, self._to_decimal(item["quantity"]))
+            except ValueError:
+                # Checkout still validates stock; the line just is not held here
+                pass
+
+    def _hold(self, product_id, quantity):
+        if self.branch_id:
+            reservations.hold(self.holder, self.branch_id, product_id, quantity)
 
     def _to_decimal(self, value):
         return Decimal(str(value))
@@ -20,24 +63,86 @@ class Cart:
 
         return (price * qty).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
+    def _figures(self, item):
+        """(subtotal, tax, total, quantity) one line contributes to the cart."""
+        if item is None:
+            return (Decimal("0"),) * 4
+
+        qty = self._to_decimal(item["quantity"])
+        total = self._to_decimal(item["total"])
+        subtotal = self._to_decimal(item["price"]) * qty
+        return subtotal, total - subtotal, total, qty
+
+    def _recount(self):
+        # Carts saved before the running totals existed
+        self.state.update({key: "0" for key in TOTAL_KEYS})
+        for item in self.cart.values():
+            self._track(None, item)
+
+    def _track(self, previous, item):
+        """Move the running totals from the previous version of a line to its new one in O(1)."""
+        if "total" not in self.state:
+            self._recount()
+
+        for key, before, after in zip(TOTAL_KEYS, self._figures(previous), self._figures(item)):
+            self.state[key] = str(self._to_decimal(self.state[key]) - before + after)
+        self.state["revision"] = self.state.get("revision", 0) + 1
+
+    def _set(self, product_id, item):
+        item["total"] = str(self._calculate_item_total(item))
+        self._track(self.cart.get(product_id), item)
+        self.cart[product_id] = item
+
+    def _write(self, product_id, item):
+        self._set(product_id, item)
+        self.storage.save_line(product_id, item, self.state)
+
     def add(self, id, name, price, qty=1, tax_rate=0):
         product_id = str(id)
         qty = self._to_decimal(qty)
 
-        if product_id not in self.cart:
-            self.cart[product_id] = {
-                "id": id,
-                "name": name,
-                "price": str(price),
+        current_qty = self._to_decimal(self.cart[product_id]["quantity"]) if product_id in self.cart else Decimal("0")
+        self._hold(product_id, current_qty + qty)
+
+        item = self.cart.get(product_id) or {
+            "id": id,
+            "name": name,
+            "price": str(price),
+            "tax_rate": str(tax_rate),
+        }
+        self._write(product_id, {**item, "quantity": str(current_qty + qty)})
+
+    def add_many(self, items):
+        """
+        Add several lines at once, e.g. a burst of scans: one hold for the
+        whole batch and one storage write. items are dicts with the arguments
+        of add(); repeated products add up.
+        """
+        changed = {}
+        for item in items:
+            product_id = str(item["id"])
+            current = changed.get(product_id) or self.cart.get(product_id) or {
+                "id": item["id"],
+                "name": item["name"],
+                "price": str(item["price"]),
+                "tax_rate": str(item.get("tax_rate", 0)),
                 "quantity": "0",
-                "tax_rate": str(tax_rate),
             }
+            quantity = self._to_decimal(current["quantity"]) + self._to_decimal(item.get("qty", 1))
+            changed[product_id] = {**current, "quantity": str(quantity)}
+
+        if not changed:
+            return []
 
-        current_qty = self._to_decimal(self.cart[product_id]["quantity"])
-        self.cart[product_id]["quantity"] = str(current_qty + qty)
-        self.cart[product_id]["total"] = str(self._calculate_item_total(self.cart[product_id]))
+        if self.branch_id:
+            reservations.hold_many(self.holder, self.branch_id, {
+                product_id: self._to_decimal(item["quantity"]) for product_id, item in changed.items()
+            })
 
-        self.save()
+        for product_id, item in changed.items():
+            self._set(product_id, item)
+        self.storage.save_lines(changed, self.state)
+        return list(changed)
 
     def update(self, product_id, quantity):
         product_id = str(product_id)
@@ -47,11 +152,10 @@ class Cart:
 
             if quantity <= 0:
                 self.remove(product_id)
-            else:
-                self.cart[product_id]["quantity"] = str(quantity)
+                return
 
-            self.cart[product_id]["total"] = str(self._calculate_item_total(self.cart[product_id]))
-            self.save()
+            self._hold(product_id, quantity)
+            self._write(product_id, {**self.cart[product_id], "quantity": str(quantity)})
 
     def increment(self, product_id, quantity=1):
         product_id = str(product_id)
@@ -71,34 +175,49 @@ class Cart:
             if new_qty <= 0:
                 self.remove(product_id)
             else:
-                self.cart[product_id]["quantity"] = str(new_qty)
-                self.cart[product_id]["total"] = str(self._calculate_item_total(self.cart[product_id]))
-                self.save()
+                self._hold(product_id, new_qty)
+                self._write(product_id, {**self.cart[product_id], "quantity": str(new_qty)})
 
     def remove(self, product_id):
         product_id = str(product_id)
 
         if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
+            self._track(self.cart.pop(product_id), None)
+            if self.branch_id:
+                reservations.release(self.holder, [product_id])
+            self.storage.delete_line(product_id, self.state)
+
+    def _aggregate(self, key):
+        if "total" not in self.state:
+            self._recount()
+        return self._to_decimal(self.state[key])
+
+    def subtotal(self):
+        return self._aggregate("subtotal")
+
+    def tax(self):
+        return self._aggregate("tax")
 
     def total(self):
-        total = sum(
-            self._calculate_item_total(item)
-            for item in self.cart.values()
-        )
-        return Decimal(total).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        return self._aggregate("total").quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
     def total_qty(self):
-        return sum(
-            self._to_decimal(item["quantity"])
-            for item in self.cart.values()
-        )
-
-    def save(self):
-        self.session["cart"] = self.cart
-        self.session.modified = True
-
-    def clear(self):
-        self.session.pop("cart", None)
-        self.session.modified = True
\ No newline at end of file
+        return self._aggregate("quantity")
+
+    @property
+    def revision(self):
+        return self.state.get("revision", 0)
+
+    def clear(self, release=True):
+        if release and self.branch_id:
+            reservations.release(self.holder)
+        self.cart = {}
+        self.storage.clear()
+
+        # The terminal stays on its branch; the revision keeps counting
+        self.state = {
+            "branch": self.branch_id,
+            "revision": self.revision + 1,
+            **{key: "0" for key in TOTAL_KEYS},
+        }
+        self.storage.save_state(self.state)
@@ -0,0 +1,269 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class CartBusy(ValueError):
+    """Another request kept the cart locked for longer than the storage waits."""
+
+
+class CartStorage:
+    """
+    Where a POS cart lives. A cart is keyed by the terminal's session key and
+    made of lines (product id -> line dict) plus a small state dict (branch and
+    the like). Lines are written one at a time, so changing one line never
+    rewrites the rest of the basket.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @property
+    def key(self):
+        session = self.request.session
+        if not session.session_key:
+            session.save()
+        return session.session_key
+
+    def load(self):
+        """Return (lines, state)."""
+        raise NotImplementedError
+
+    def save_line(self, product_id, line, state):
+        raise NotImplementedError
+
+    def save_lines(self, lines, state):
+        """Write several changed lines in one go."""
+        raise NotImplementedError
+
+    def delete_line(self, product_id, state):
+        raise NotImplementedError
+
+    def save_state(self, state):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class SessionCartStorage(CartStorage):
+    """The original behaviour: the whole cart inside request.session."""
+
+    def load(self):
+        session = self.request.session
+        return dict(session.get("cart", {})), dict(session.get("cart_state", {}))
+
+    def _write(self, lines, state):
+        self.request.session["cart"] = lines
+        self.request.session["cart_state"] = state
+        self.request.session.modified = True
+
+    def save_line(self, product_id, line, state):
+        lines = self.request.session.get("cart", {})
+        lines[product_id] = line
+        self._write(lines, state)
+
+    def save_lines(self, changed, state):
+        lines = self.request.session.get("cart", {})
+        lines.update(changed)
+        self._write(lines, state)
+
+    def delete_line(self, product_id, state):
+        lines = self.request.session.get("cart", {})
+        lines.pop(product_id, None)
+        self._write(lines, state)
+
+    def save_state(self, state):
+        self._write(self.request.session.get("cart", {}), state)
+
+    def clear(self):
+        self.request.session.pop("cart", None)
+        self.request.session.pop("cart_state", None)
+        self.request.session.modified = True
+
+
+class MemoryCartStorage(CartStorage):
+    """Process-local storage for tests and single-process development servers."""
+
+    _lock = threading.Lock()
+    _carts = {}
+
+    def _cart(self):
+        return self._carts.setdefault(self.key, {"lines": {}, "state": {}})
+
+    def load(self):
+        with self._lock:
+            cart = copy.deepcopy(self._cart())
+        return cart["lines"], cart["state"]
+
+    def save_line(self, product_id, line, state):
+        with self._lock:
+            cart = self._cart()
+            cart["lines"][product_id] = copy.deepcopy(line)
+            cart["state"] = copy.deepcopy(state)
+
+    def save_lines(self, lines, state):
+        with self._lock:
+            cart = self._cart()
+            cart["lines"].update(copy.deepcopy(lines))
+            cart["state"] = copy.deepcopy(state)
+
+    def delete_line(self, product_id, state):
+        with self._lock:
+            cart = self._cart()
+            cart["lines"].pop(product_id, None)
+            cart["state"] = copy.deepcopy(state)
+
+    def save_state(self, state):
+        with self._lock:
+            self._cart()["state"] = copy.deepcopy(state)
+
+    def clear(self):
+        with self._lock:
+            self._carts.pop(self.key, None)
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._carts.clear()
+
+
+class CacheCartStorage(CartStorage):
+    """
+    Cart in a Django cache (settings.CART_CACHE_ALIAS): one entry per line plus
+    an index of product ids and the state. Loading costs two cache round trips
+    and a change writes the touched line, the index and the state in one
+    set_many. Use a shared cache (Redis, Memcached, files on one host) when
+    several workers serve the POS.
+
+    Writes hold a short per-cart lock and merge into the index as it is at
+    that moment, so two overlapping requests of one terminal cannot drop each
+    other's lines; a write that cannot get the lock within lock_wait raises
+    CartBusy. A lock older than lock_timeout was left by a crashed worker. When the cart changed since it was loaded, the running totals
+    are dropped from the state and recounted from the lines.
+
+    The cache must not cull or evict entries: that drops single lines of a
+    live cart. Size MAX_ENTRIES (or Redis maxmemory) for every open cart.
+    Lines found missing on load are left out and the totals recounted.
+    """
+
+    lock_timeout = 5
+    lock_wait = 2
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cache = caches[settings.CART_CACHE_ALIAS]
+        self._revision = None
+
+    def _cache_key(self, *parts):
+        return ":".join(("cart", self.key, *parts))
+
+    def load(self):
+        index_key, state_key = self._cache_key("lines"), self._cache_key("state")
+        head = self.cache.get_many([index_key, state_key])
+        ids = list(head.get(index_key, []))
+
+        line_keys = {self._cache_key("line", product_id): product_id for product_id in ids}
+        found = self.cache.get_many(list(line_keys)) if line_keys else {}
+        lines = {line_keys[key]: line for key, line in found.items()}
+
+        state = head.get(state_key, {})
+        if len(lines) < len(ids):
+            state.pop("total", None)
+        self._revision = state.get("revision", 0)
+        return lines, state
+
+    def _acquire(self, key, token):
+        directory = getattr(self.cache, "_dir", None)
+        if directory is None:
+            return self.cache.add(key, token, self.lock_timeout)
+
+        # FileBasedCache.add checks then sets; creating a lock file with O_EXCL is atomic
+        path = os.path.join(directory, hashlib.md5(key.encode()).hexdigest() + ".lock")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > self.lock_timeout:
+                    os.remove(path)
+            except OSError:
+                pass
+            return False
+
+    @contextmanager
+    def _locked(self):
+        key, token = self._cache_key("lock"), uuid.uuid4().hex
+        # A lock left behind by a crashed worker expires after lock_timeout, so
+        # giving up first never takes over a lock that is still in use
+        deadline = time.monotonic() + self.lock_wait
+        acquired = self._acquire(key, token)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.005)
+            acquired = self._acquire(key, token)
+        if not acquired:
+            raise CartBusy("The cart is being changed by another request, try again")
+        try:
+            yield
+        finally:
+            if isinstance(acquired, str):
+                try:
+                    os.remove(acquired)
+                except OSError:
+                    pass
+            elif acquired and self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def _write(self, lines, state, deleted=()):
+        """Under the cart lock: merge into the current index, then write lines, index and state together."""
+        with self._locked():
+            index_key, state_key = self._cache_key("lines"), self._cache_key("state")
+            head = self.cache.get_many([index_key, state_key])
+            ids = [product_id for product_id in head.get(index_key, []) if product_id not in deleted]
+            ids.extend(product_id for product_id in lines if product_id not in ids)
+
+            stored = head.get(state_key, {}).get("revision", 0)
+            if self._revision is not None and stored != self._revision:
+                # Another request changed the cart meanwhile; our running totals miss its change
+                state.pop("total", None)
+                state["revision"] = max(stored, state.get("revision", 0)) + 1
+            self._revision = state.get("revision", 0)
+
+            entries = {self._cache_key("line", product_id): line for product_id, line in lines.items()}
+            entries[index_key] = ids
+            entries[state_key] = state
+            if deleted:
+                self.cache.delete_many([self._cache_key("line", product_id) for product_id in deleted])
+            self.cache.set_many(entries, settings.CART_TTL)
+
+    def save_line(self, product_id, line, state):
+        self._write({product_id: line}, state)
+
+    def save_lines(self, lines, state):
+        self._write(lines, state)
+
+    def delete_line(self, product_id, state):
+        self._write({}, state, deleted={product_id})
+
+    def save_state(self, state):
+        self._write({}, state)
+
+    def clear(self):
+        with self._locked():
+            ids = self.cache.get(self._cache_key("lines"), [])
+            self.cache.delete_many(
+                [self._cache_key("line", product_id) for product_id in ids]
+                + [self._cache_key("lines"), self._cache_key("state")]
+            )
+        self._revision = 0
+
+
+def get_cart_storage(request):
+    return import_string(settings.CART_STORAGE)(request)
@@ -0,0 +1,160 @@
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from accounts.models import Branch, User
+from customers.models import Customer
+from inventory.models import Brand, Category, Product, Stock, StockMovement
+from payments.models import PaymentMethod
+from sales.models import Sale
+from sales.sequences import allocator
+from sales.services import create_sale
+from services.transactions import contention_stats, reset_contention_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark create_sale latency and query count against basket size, then run checkouts from "
+        "concurrent workers on the same products and report lock contention. The bench data is "
+        "committed (so retry_on_conflict can retry) and deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", nargs="+", type=int, default=[1, 5, 10, 20, 40, 80])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--workers", type=int, default=4, help="Concurrent checkouts in the contention run (0 skips it)")
+        parser.add_argument("--hot-lines", type=int, default=5, help="Products every concurrent checkout buys")
+
+    def handle(self, *args, **options):
+        self.cleanup()
+        try:
+            fixture = self.setup(max(options["lines"] + [options["hot_lines"]]))
+            self.run(fixture, options["lines"], options["repeat"])
+            if options["workers"]:
+                reset_contention_stats()
+                self.run_concurrent(fixture, options["workers"], options["repeat"], options["hot_lines"])
+                self.report_contention()
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        branch = Branch.objects.filter(code="BENCH").first()
+        if branch:
+            Sale.objects.filter(branch=branch).delete()
+            StockMovement.objects.filter(branch=branch).delete()
+            Stock.objects.filter(branch=branch).delete()
+            branch.delete()
+        Product.objects.filter(sku__startswith="BENCH-").delete()
+        Customer.objects.filter(phone="bench-checkout").delete()
+        PaymentMethod.objects.filter(code="bench-checkout").delete()
+        Brand.objects.filter(name="bench-checkout").delete()
+        Category.objects.filter(name="bench-checkout").delete()
+        User.objects.filter(username="bench-checkout").delete()
+        allocator.reset()
+
+    def report_contention(self):
+        stats = contention_stats()
+        if not stats:
+            return
+        self.stdout.write(f"\n{'function':<40} {'calls':>6} {'conflicts':>10} {'retries':>8} {'failures':>9} {'wait s':>8}")
+        for name, entry in sorted(stats.items()):
+            self.stdout.write(
+                f"{name.rsplit('.', 1)[-1]:<40} {entry['calls']:>6} {entry['conflicts']:>10} "
+                f"{entry['retries']:>8} {entry['failures']:>9} {entry['wait_seconds']:>8.3f}"
+            )
+
+    def setup(self, product_count):
+        user = User.objects.create(username="bench-checkout", phone="bench-checkout")
+        branch = Branch.objects.create(name="Bench", code="BENCH", address="-")
+        method = PaymentMethod.objects.create(name="Bench", code="bench-checkout")
+        category = Category.objects.create(name="bench-checkout")
+        brand = Brand.objects.create(name="bench-checkout")
+
+        products = Product.objects.bulk_create([
+            Product(
+                name=f"Bench product {i}",
+                sku=f"BENCH-{i}",
+                barcode=f"BENCH-{i}",
+                category=category,
+                brand=brand,
+                cost_price=Decimal("1.00"),
+                selling_price=Decimal("2.00"),
+                tax_rate=Decimal("5.00"),
+            )
+            for i in range(product_count)
+        ])
+        Stock.objects.bulk_create([
+            Stock(product=product, branch=branch, quantity=Decimal("1000000"), reorder_level=0)
+            for product in products
+        ])
+        return user, branch, method, products
+
+    def checkout(self, fixture, count):
+        """(cart, post data) buying one of each of the first count bench products."""
+        _, branch, method, products = fixture
+        cart = {
+            str(product.id): {
+                "id": product.id,
+                "name": product.name,
+                "price": "2.00",
+                "quantity": "1",
+                "tax_rate": "5.00",
+                "total": "2.10",
+            }
+            for product in products[:count]
+        }
+        post = QueryDict(mutable=True)
+        post.update({"discount_amount": "0", "branch": str(branch.id), "phone": "bench-checkout"})
+        post.setlist("payment_method[]", [str(method.id)])
+        post.setlist("payment_amount[]", [str(Decimal("2.10") * count)])
+        post.setlist("payment_note[]", [""])
+        return cart, post
+
+    def run(self, fixture, line_counts, repeat):
+        user = fixture[0]
+        self.stdout.write(f"{'lines':>6} {'queries':>8} {'avg ms':>10} {'ms/line':>10}")
+        for count in line_counts:
+            cart, post = self.checkout(fixture, count)
+
+            elapsed = 0.0
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    create_sale(cart_data=cart, post_data=post, user=user)
+                    elapsed += time.perf_counter() - started
+
+            avg_ms = elapsed / repeat * 1000
+            self.stdout.write(f"{count:>6} {len(queries):>8} {avg_ms:>10.2f} {avg_ms / count:>10.3f}")
+
+    def run_concurrent(self, fixture, workers, repeat, hot_lines):
+        """Every worker sells the same hot_lines products repeat times, so their Stock rows are fought over."""
+        user = fixture[0]
+        cart, post = self.checkout(fixture, hot_lines)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(repeat):
+                    try:
+                        create_sale(cart_data=cart, post_data=post, user=user)
+                    except DatabaseError as exc:
+                        errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        done = workers * repeat - len(errors)
+        self.stdout.write(
+            f"\n{workers} workers x {repeat} checkouts of {hot_lines} shared lines: "
+            f"{done} done, {len(errors)} failed in {elapsed:.2f}s"
+        )
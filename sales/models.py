@@ -18,6 +18,7 @@ class Sale(models.Model):
     ]
 
     receipt_number = models.CharField(max_length=30,unique=True,null=True,blank=True)
+    idempotency_key = models.CharField(max_length=64,unique=True,null=True,blank=True,editable=False, help_text='client generated checkout key')
     branch = models.ForeignKey("accounts.Branch",on_delete=models.PROTECT,related_name="sales")
 
     cashier = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.PROTECT,related_name="sales")
@@ -99,3 +100,16 @@ class SaleItem(models.Model):
     def __str__(self):
         return f"{self.product} x {self.quantity}"
 
+
+class NumberSequence(models.Model):
+    name = models.CharField(max_length=30, help_text='receipt, payment, ...')
+    branch = models.ForeignKey("accounts.Branch",on_delete=models.CASCADE,related_name="sequences")
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'branch'], name='unique_sequence_name_branch'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} - {self.branch} ({self.next_value})"
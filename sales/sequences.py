@@ -0,0 +1,70 @@
+import os
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from sales.models import NumberSequence
+
+
+class SequenceAllocator:
+    """
+    Hi/lo allocator for per-branch document numbers.
+
+    Each worker process reserves a block of SEQUENCE_BLOCK_SIZE numbers with one
+    UPDATE on NumberSequence and then hands them out from memory. Numbers are
+    unique across processes and increasing within a worker; blocks left unused
+    when a worker stops simply become gaps.
+
+    Reserve numbers outside the checkout transaction: a block reserved inside
+    a transaction that later rolls back could be handed out a second time.
+    """
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._pid = os.getpid()
+
+    def allocate(self, name, branch, count=1):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: never reuse the parent's blocks
+                self._blocks.clear()
+                self._pid = os.getpid()
+
+            key = (name, branch.pk)
+            values = []
+            while len(values) < count:
+                block = self._blocks.get(key)
+                if block is None or block[0] >= block[1]:
+                    block = self._blocks[key] = self._reserve(name, branch, count - len(values))
+
+                take = min(count - len(values), block[1] - block[0])
+                values.extend(range(block[0], block[0] + take))
+                block[0] += take
+
+            return values
+
+    def _reserve(self, name, branch, wanted):
+        size = max(self.block_size or settings.SEQUENCE_BLOCK_SIZE, wanted)
+
+        with transaction.atomic():
+            sequence, _ = NumberSequence.objects.select_for_update().get_or_create(name=name, branch=branch)
+            NumberSequence.objects.filter(pk=sequence.pk).update(next_value=F('next_value') + size)
+
+        return [sequence.next_value, sequence.next_value + size]
+
+    def reset(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+allocator = SequenceAllocator()
+
+
+def receipt_numbers(branch, count=1):
+    return [f"{branch.code}-{value:08d}" for value in allocator.allocate("receipt", branch, count)]
+
+
+def payment_numbers(branch, count=1):
+    return [f"{branch.code}-P{value:08d}" for value in allocator.allocate("payment", branch, count)]
@@ -0,0 +1,28 @@
+from rest_framework import serializers
+from accounts.models import Branch
+
+class IngestedSaleLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    tax_rate = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, default=0)
+
+class IngestedPaymentSerializer(serializers.Serializer):
+    method = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    note = serializers.CharField(required=False, allow_blank=True, default="")
+
+class IngestedSaleSerializer(serializers.Serializer):
+    idempotency_key = serializers.CharField(max_length=64, required=False, allow_blank=True)
+    phone = serializers.CharField(max_length=20, required=False, allow_blank=True)
+    name = serializers.CharField(max_length=150, required=False, allow_blank=True, default="")
+    email = serializers.EmailField(required=False, allow_blank=True)
+    address = serializers.CharField(required=False, allow_blank=True, default="")
+    note = serializers.CharField(required=False, allow_blank=True, default="")
+    discount_amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+    lines = IngestedSaleLineSerializer(many=True, allow_empty=False)
+    payments = IngestedPaymentSerializer(many=True, allow_empty=False)
+
+class SaleBatchSerializer(serializers.Serializer):
+    branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all())
+    sales = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=500)
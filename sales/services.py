@@ -1,36 +1,20 @@
-from django.shortcuts import get_object_or_404, get_list_or_404
-from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+from django.shortcuts import get_object_or_404
+from decimal import Decimal, InvalidOperation
 from payments.models import PaymentMethod, Payment
-from inventory.models import Stock, Product, StockMovement
-from inventory.services import apply_stock_movement
+from inventory.models import Stock, StockMovement
+from inventory import reservations
+from inventory.services import apply_stock_movements, lock_stocks, sharded_stocks, take_from_shards
 from accounts.models import Branch
-from customers.models import Customer, CustomerAddress
-from django.db import transaction
+from customers.services import get_or_create_customer_id, ensure_address, resolve_customer_ids, cache as customer_cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from sales.models import Sale, SaleItem
+from sales.sequences import receipt_numbers, payment_numbers
+from services.transactions import retry_on_conflict
 
-@transaction.atomic
-def create_sale(cart_data, post_data, user):
-    if not cart_data:
-        raise ValueError("Your cart is empty")
-
-    discount_amount = Decimal(post_data['discount_amount']) or 0
-    cart_total = sum(
-        Decimal(item["total"])
-        for item in cart_data.values()
-    )
-    
-    payable_amount = cart_total - discount_amount
-    payment_amounts = post_data.getlist("payment_amount[]")
-    payment_methods = post_data.getlist("payment_method[]")
-    payment_notes = post_data.getlist("payment_note[]")
-
-    if not payment_amounts:
-        raise ValueError("At least one payment is required")
-
+def clean_payments(rows):
     payments = []
-    total_payment = Decimal("0.00")
-
-    for amount, method, note in zip(payment_amounts, payment_methods, payment_notes):
+    for amount, method, note in rows:
         if not amount or not method:
             continue
 
@@ -38,130 +22,433 @@ def create_sale(cart_data, post_data, user):
             amount = Decimal(amount)
         except InvalidOperation:
             continue
-        
+
         if amount <= 0:
             continue
-        
+
         payments.append({
-            'payment_method': PaymentMethod.objects.get(pk=method),
             "method": method,
             "amount": amount,
             "notes": note or ""
         })
 
-        total_payment += amount
-    
     if not payments:
         raise ValueError("Valid payment information is required")
 
+    return payments
+
+def attach_payment_methods(payments, methods=None):
+    if methods is None:
+        methods = PaymentMethod.objects.in_bulk({payment["method"] for payment in payments})
+
+    for payment in payments:
+        try:
+            payment["payment_method"] = methods[int(payment["method"])]
+        except (KeyError, ValueError):
+            raise PaymentMethod.DoesNotExist("PaymentMethod matching query does not exist.")
+
+    return payments
+
+def parse_payments(post_data):
+    payment_amounts = post_data.getlist("payment_amount[]")
+    payment_methods = post_data.getlist("payment_method[]")
+    payment_notes = post_data.getlist("payment_note[]")
+
+    if not payment_amounts:
+        raise ValueError("At least one payment is required")
+
+    payments = clean_payments(zip(payment_amounts, payment_methods, payment_notes))
+    return attach_payment_methods(payments)
+
+def price_line(item):
+    qty = Decimal(item['quantity'])
+    unit_price = Decimal(item['price'])
+    tax_rate = Decimal(item['tax_rate'] or 0)
+
+    item_subtotal = unit_price * qty
+    tax_amount = (item_subtotal * tax_rate / 100).quantize(Decimal("0.01"))
+
+    return {
+        "product_id": int(item['id']),
+        "name": item['name'],
+        "quantity": qty,
+        "unit_price": unit_price,
+        "tax_rate": tax_rate,
+        "subtotal": item_subtotal,
+        "tax_amount": tax_amount,
+        "total_price": item_subtotal + tax_amount,
+    }
+
+def get_replayed_sale(idempotency_key):
+    """Sale already recorded for this checkout key, looked up by its unique index without locks."""
+    if not idempotency_key:
+        return None
+
+    sale = Sale.objects.filter(idempotency_key=idempotency_key).first()
+    if sale:
+        sale.replayed = True
+    return sale
+
+def create_sale(cart_data, post_data, user, idempotency_key=None, holder=None):
+    idempotency_key = (idempotency_key or post_data.get('idempotency_key') or '').strip() or None
+    if idempotency_key and len(idempotency_key) > 64:
+        raise ValueError("Invalid idempotency key")
+
+    # A resubmitted checkout returns the original sale instead of selling twice
+    replayed = get_replayed_sale(idempotency_key)
+    if replayed:
+        return replayed
+
+    if not cart_data:
+        raise ValueError("Your cart is empty")
+
+    discount_amount = Decimal(post_data['discount_amount']) or 0
+    lines = [price_line(item) for item in cart_data.values()]
+    cart_total = sum(
+        Decimal(item["total"])
+        for item in cart_data.values()
+    )
+
+    payable_amount = cart_total - discount_amount
+    payments = parse_payments(post_data)
+    total_payment = sum((payment["amount"] for payment in payments), Decimal("0.00"))
+
     if total_payment < payable_amount:
         raise ValueError(
             f"Insufficient payment. Required: {payable_amount}, Paid: {total_payment}"
         )
-    
+
     # Get Branch
     branch = get_object_or_404(Branch, pk=post_data['branch'])
-    
-    # Create Customer & CustomerAddress
-    customer, _ = Customer.objects.get_or_create(
-        phone=post_data['phone'], 
-        defaults={'name':post_data.get('q',''), 'email':post_data.get('email', ''), 'loyalty_points':0}
-    )
-    if post_data.get('address'):
-        CustomerAddress.objects.get_or_create(
-            customer=customer,
-            address=post_data['address'],
-            defaults={'is_default':True}
-        )
-    
-    # Create Sale
+
+    # Numbers are reserved before the transaction so a retry or rollback never reuses them
+    receipt_number = receipt_numbers(branch)[0]
+    for payment, number in zip(payments, payment_numbers(branch, len(payments))):
+        payment["number"] = number
+
+    try:
+        return save_sale(branch, lines, payments, discount_amount, receipt_number, post_data, user, idempotency_key, holder)
+    except IntegrityError:
+        # The same key committed concurrently (double submit racing the first request)
+        replayed = get_replayed_sale(idempotency_key)
+        if replayed is None:
+            # Possibly a cached customer deleted by another worker; look it up afresh next time
+            customer_cache.clear()
+            raise
+        return replayed
+
+@retry_on_conflict
+@transaction.atomic
+def save_sale(branch, lines, payments, discount_amount, receipt_number, post_data, user, idempotency_key=None, holder=None):
+    subtotal = sum((line["subtotal"] for line in lines), Decimal("0.00"))
+    total_tax = sum((line["tax_amount"] for line in lines), Decimal("0.00"))
+
+    # Customer & address: no query for a recent customer, one indexed lookup otherwise
+    customer_id = get_or_create_customer_id(post_data['phone'], post_data.get('q', ''), post_data.get('email'))
+    ensure_address(customer_id, post_data.get('address'))
+
+    # Create Sale with its final number and totals
     sale = Sale.objects.create(
+        receipt_number=receipt_number,
+        idempotency_key=idempotency_key,
         branch=branch,
         cashier=user,
-        customer=customer,
-        subtotal=cart_total,
-        tax_amount=0,
+        customer_id=customer_id,
+        subtotal=subtotal,
+        tax_amount=total_tax,
         discount_amount=discount_amount,
-        total_amount=cart_total,
-        status='DRAFT',
+        total_amount=subtotal + total_tax - discount_amount,
+        status=Sale.COMPLETED,
         notes=post_data.get('note', ''),
     )
 
-    subtotal = Decimal("0.00")
-    total_tax = Decimal("0.00")
-    for item in cart_data.values():
-        product = Product.objects.select_for_update().get(pk=item['id'])
-
-        if not product:
-            continue
-        
-        # Stock lock and validation
-        stock, _ = Stock.objects.select_for_update().get_or_create(
-            product=product,
+    # Stock lock, validation and OUT movements for the whole basket at once
+    apply_stock_movements([
+        StockMovement(
+            product_id=line["product_id"],
             branch=branch,
-            defaults={'quantity': 0, 'reorder_level': 1}
+            movement_type=StockMovement.OUT,
+            quantity=line["quantity"],
+            reference=f"SALE:{sale.id}",
         )
+        for line in lines
+    ], user)
 
-        qty = Decimal(item['quantity'])
-        unit_price = Decimal(item['price'])
+    # What other carts hold stays theirs: the sale may only take the rest
+    names = {line["product_id"]: line["name"] for line in lines}
+    available = reservations.available_to_sell(branch.pk, list(names), exclude_holder=holder)
+    for product_id, left in available.items():
+        if left < 0:
+            raise ValueError(f"Insufficient stock for product {names[product_id]} at branch {branch.name} (held by other carts)")
 
-        if stock.quantity < qty:
-            raise ValueError(f'Insufficient stock for product {item['name']} at branch {branch.name}')
-        
-        # Calculation
-        item_subtotal = unit_price * qty
-        tax_rate = Decimal(item['tax_rate'] or 0)
-        tax_amount = (item_subtotal * tax_rate / 100).quantize(Decimal("0.01"))
-        total_price = item_subtotal + tax_amount
+    SaleItem.objects.bulk_create([
+        SaleItem(
+            sale=sale,
+            product_id=line["product_id"],
+            quantity=line["quantity"],
+            unit_price=line["unit_price"],
+            tax_rate=line["tax_rate"],
+            tax_amount=line["tax_amount"],
+            total_price=line["total_price"],
+        )
+        for line in lines
+    ])
 
-        # Create SaleItem
-        SaleItem.objects.create(
+    # Create Payment
+    Payment.objects.bulk_create([
+        Payment(
+            number=payment["number"],
             sale=sale,
-            product=product,
-            quantity=qty,
-            unit_price=unit_price,
-            tax_rate=tax_rate,
-            tax_amount=tax_amount,
-            total_price=total_price,
+            method=payment["payment_method"],
+            amount=payment["amount"],
+            status='completed',
+            notes=payment["notes"],
+            processed_by=user,
         )
+        for payment in payments
+    ])
 
-        # Create StockMovement (OUT)
-        movement = StockMovement.objects.create(
-            product=product,
-            branch=branch,
-            movement_type="OUT",
-            quantity=qty,
-            reference=f"SALE:{sale.id}",
-            created_by=user,
+    # The cart's holds turn into the movements above
+    if holder:
+        reservations.release(holder)
+
+    return sale
+
+def prepare_sale(index, data):
+    """Price and validate one ingested sale payload; raises ValueError on bad input."""
+    lines = [
+        price_line({
+            "id": line["product"],
+            "name": f"#{line['product']}",
+            "price": line["price"],
+            "quantity": line["quantity"],
+            "tax_rate": line.get("tax_rate") or 0,
+        })
+        for line in data["lines"]
+    ]
+    if not lines:
+        raise ValueError("The sale has no lines")
+    if any(line["quantity"] <= 0 for line in lines):
+        raise ValueError("Quantity must be greater than zero")
+
+    subtotal = sum((line["subtotal"] for line in lines), Decimal("0.00"))
+    total_tax = sum((line["tax_amount"] for line in lines), Decimal("0.00"))
+    discount_amount = Decimal(data.get("discount_amount") or 0)
+    payable_amount = (subtotal + total_tax - discount_amount).quantize(Decimal("0.01"))
+
+    payments = clean_payments(
+        (payment.get("amount"), payment.get("method"), payment.get("note"))
+        for payment in data.get("payments", [])
+    )
+    total_payment = sum((payment["amount"] for payment in payments), Decimal("0.00"))
+    if total_payment < payable_amount:
+        raise ValueError(
+            f"Insufficient payment. Required: {payable_amount}, Paid: {total_payment}"
         )
 
-        apply_stock_movement(movement, user)
+    return {
+        "index": index,
+        "idempotency_key": data.get("idempotency_key") or None,
+        "phone": data.get("phone") or None,
+        "name": data.get("name", ""),
+        "email": data.get("email") or None,
+        "address": data.get("address", ""),
+        "note": data.get("note", ""),
+        "lines": lines,
+        "payments": payments,
+        "subtotal": subtotal,
+        "tax_amount": total_tax,
+        "discount_amount": discount_amount,
+        "total_amount": payable_amount,
+    }
 
-        subtotal += item_subtotal
-        total_tax += tax_amount
-    
-    # Final Sale Totals
-    sale.receipt_number = sale.id
-    sale.subtotal = subtotal
-    sale.tax_amount = total_tax
-    sale.discount_amount = discount_amount
-    sale.total_amount = subtotal + total_tax - discount_amount
-    sale.status = 'COMPLETED'
-    sale.save()
+def sale_error(index, error):
+    return {"index": index, "status": "error", "error": str(error)}
 
-    # Create Payment
-    for payment in payments:
-        pay = Payment.objects.create(
-            sale=sale,
-            method=payment.get('payment_method'),
-            amount=payment.get('amount'),
-            status='pending',
-            notes=payment.get('notes'),
-            processed_by=user,
+def ingest_sales(branch, sales_data, user, retry_duplicates=True):
+    """
+    Record many completed sales of one branch in one pass: validation and
+    payment-method lookup for the whole batch up front, one grouped stock lock,
+    and bulk inserts for sales, items, movements and payments.
+
+    sales_data is a list of (index, payload) pairs; the result is one dict per
+    pair, in the same order, with status "created", "replayed" or "error".
+    A sale that fails (bad payload, unknown payment method, not enough stock)
+    is reported and skipped without affecting the rest of the batch.
+    """
+    results = {}
+    pending = []
+    seen_keys = set()
+    for index, data in sales_data:
+        key = data.get("idempotency_key")
+        if key and key in seen_keys:
+            results[index] = sale_error(index, "Duplicate idempotency key in batch")
+            continue
+        seen_keys.add(key)
+
+        try:
+            pending.append(prepare_sale(index, data))
+        except (ValueError, InvalidOperation, KeyError) as e:
+            results[index] = sale_error(index, e)
+
+    keys = [sale["idempotency_key"] for sale in pending if sale["idempotency_key"]]
+    if keys:
+        existing = {
+            row["idempotency_key"]: row
+            for row in Sale.objects.filter(idempotency_key__in=keys).values("idempotency_key", "id", "receipt_number")
+        }
+        for sale in [sale for sale in pending if sale["idempotency_key"] in existing]:
+            row = existing[sale["idempotency_key"]]
+            results[sale["index"]] = {"index": sale["index"], "status": "replayed", "sale": row["id"], "receipt_number": row["receipt_number"]}
+            pending.remove(sale)
+
+    methods = PaymentMethod.objects.in_bulk({payment["method"] for sale in pending for payment in sale["payments"]})
+    for sale in list(pending):
+        try:
+            attach_payment_methods(sale["payments"], methods)
+        except PaymentMethod.DoesNotExist as e:
+            results[sale["index"]] = sale_error(sale["index"], e)
+            pending.remove(sale)
+
+    if pending:
+        # Numbers are reserved before the transaction so a retry or rollback never reuses them
+        receipts = iter(receipt_numbers(branch, len(pending)))
+        numbers = iter(payment_numbers(branch, sum(len(sale["payments"]) for sale in pending)))
+        for sale in pending:
+            sale["receipt_number"] = next(receipts)
+            for payment in sale["payments"]:
+                payment["number"] = next(numbers)
+
+        try:
+            results.update(save_sales(branch, pending, user))
+        except IntegrityError:
+            # A key of this batch was committed concurrently; run again so it is reported as replayed
+            if not retry_duplicates:
+                raise
+            return ingest_sales(branch, sales_data, user, retry_duplicates=False)
+
+    return [results[index] for index, _ in sales_data]
+
+def resolve_customers(sales):
+    return resolve_customer_ids(
+        (sale["phone"], sale["name"], sale["email"], sale["address"])
+        for sale in sales
+        if sale["phone"]
+    )
+
+@retry_on_conflict
+@transaction.atomic
+def save_sales(branch, pending, user):
+    results = {}
+    product_ids = {line["product_id"] for sale in pending for line in sale["lines"]}
+    stocks = lock_stocks(branch, product_ids)
+    missing = product_ids - set(stocks)
+    sharded = sharded_stocks(branch, missing) if missing else {}
+    customers = resolve_customers(pending)
+    # Stock held by open carts is not for sale here; read after the lock so holds cannot grow meanwhile
+    available = reservations.available_to_sell(branch.pk, product_ids)
+
+    accepted = []
+    changed = {}
+    for sale in pending:
+        needed = {}
+        for line in sale["lines"]:
+            needed[line["product_id"]] = needed.get(line["product_id"], Decimal("0.00")) + line["quantity"]
+
+        try:
+            for product_id, quantity in needed.items():
+                if product_id in sharded:
+                    continue
+                stock = stocks.get(product_id)
+                if stock is None or stock.quantity < quantity:
+                    name = stock.product.name if stock else f"#{product_id}"
+                    raise ValueError(f"Insufficient stock for product {name} at branch {branch.name}")
+            for product_id, quantity in needed.items():
+                if quantity > available[product_id]:
+                    left = max(available[product_id], Decimal("0.00"))
+                    raise ValueError(f"Only {left} of product #{product_id} available to sell at branch {branch.name}")
+
+            sharded_needed = [(sharded[product_id], quantity) for product_id, quantity in needed.items() if product_id in sharded]
+            if sharded_needed:
+                with transaction.atomic():
+                    for stock, quantity in sharded_needed:
+                        try:
+                            take_from_shards(stock, quantity)
+                        except ValueError:
+                            raise ValueError(f"Insufficient stock for product {stock.product.name} at branch {branch.name}")
+        except ValueError as e:
+            results[sale["index"]] = sale_error(sale["index"], e)
+            continue
+
+        for product_id, quantity in needed.items():
+            available[product_id] -= quantity
+            if product_id not in sharded:
+                stocks[product_id].quantity -= quantity
+                changed[product_id] = stocks[product_id]
+        accepted.append(sale)
+
+    if not accepted:
+        return results
+
+    sales = Sale.objects.bulk_create([
+        Sale(
+            receipt_number=sale["receipt_number"],
+            idempotency_key=sale["idempotency_key"],
+            branch=branch,
+            cashier=user,
+            customer_id=customers.get(sale["phone"]),
+            subtotal=sale["subtotal"],
+            tax_amount=sale["tax_amount"],
+            discount_amount=sale["discount_amount"],
+            total_amount=sale["total_amount"],
+            status=Sale.COMPLETED,
+            notes=sale["note"],
         )
+        for sale in accepted
+    ])
 
-        pay.number = pay.id
-        pay.status = 'completed'
-        pay.save()
+    items = []
+    movements = []
+    payments = []
+    for sale, data in zip(sales, accepted):
+        for line in data["lines"]:
+            items.append(SaleItem(
+                sale=sale,
+                product_id=line["product_id"],
+                quantity=line["quantity"],
+                unit_price=line["unit_price"],
+                tax_rate=line["tax_rate"],
+                tax_amount=line["tax_amount"],
+                total_price=line["total_price"],
+            ))
+            movements.append(StockMovement(
+                product_id=line["product_id"],
+                branch=branch,
+                movement_type=StockMovement.OUT,
+                quantity=line["quantity"],
+                reference=f"SALE:{sale.id}",
+                created_by=user,
+            ))
+        for payment in data["payments"]:
+            payments.append(Payment(
+                number=payment["number"],
+                sale=sale,
+                method=payment["payment_method"],
+                amount=payment["amount"],
+                status='completed',
+                notes=payment["notes"],
+                processed_by=user,
+            ))
 
-    return sale
+        results[data["index"]] = {"index": data["index"], "status": "created", "sale": sale.id, "receipt_number": sale.receipt_number}
+
+    SaleItem.objects.bulk_create(items)
+    StockMovement.objects.bulk_create(movements)
+    Payment.objects.bulk_create(payments)
+
+    now = timezone.now()
+    for stock in changed.values():
+        stock.updated_at = now
+    Stock.objects.bulk_update(changed.values(), ["quantity", "updated_at"])
+
+    return results
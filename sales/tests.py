@@ -1,3 +1,148 @@
-from django.test import TestCase
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.http import QueryDict
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from accounts.models import Branch
+from customers.models import Customer
+from customers.services import cache as customer_cache
+from inventory.models import Category, Product, Stock, StockMovement, StockReservation
+from inventory.reservations import hold
+from payments.models import Payment, PaymentMethod
+from sales.cart import Cart
+from sales.cart_storage import CacheCartStorage, CartBusy, MemoryCartStorage
+from sales.models import Sale
+from sales.sequences import allocator
+from sales.services import create_sale
 
-# Create your tests here.
+
+class CreateSaleTests(TestCase):
+    def setUp(self):
+        allocator.reset()
+        customer_cache.clear()
+        self.user = get_user_model().objects.create_user(username="cashier", password="secret", phone="100")
+        self.branch = Branch.objects.create(name="Main", code="MAIN", address="-")
+        self.method = PaymentMethod.objects.create(name="Cash", code="cash")
+        category = Category.objects.create(name="Dairy")
+        self.milk = Product.objects.create(
+            name="Milk", sku="1001", barcode="1001", category=category,
+            cost_price="1.00", selling_price="2.00", tax_rate="5.00",
+        )
+        self.stock = Stock.objects.create(product=self.milk, branch=self.branch, quantity=5, reorder_level=1)
+
+    def cart(self, quantity):
+        return {
+            str(self.milk.id): {
+                "id": self.milk.id, "name": self.milk.name, "price": "2.00",
+                "quantity": str(quantity), "tax_rate": "5.00", "total": str(Decimal("2.10") * quantity),
+            }
+        }
+
+    def post(self, amount, **extra):
+        post = QueryDict(mutable=True)
+        post.update({"discount_amount": "0", "branch": str(self.branch.id), "phone": "01700000000", **extra})
+        post.setlist("payment_method[]", [str(self.method.id)])
+        post.setlist("payment_amount[]", [str(amount)])
+        post.setlist("payment_note[]", [""])
+        return post
+
+    def sell(self, quantity, holder=None, **extra):
+        return create_sale(
+            cart_data=self.cart(quantity), post_data=self.post(Decimal("2.10") * quantity, **extra), user=self.user, holder=holder,
+        )
+
+    def on_hand(self):
+        self.stock.refresh_from_db()
+        return self.stock.on_hand
+
+    def test_sale_decrements_stock_and_numbers_receipts_and_payments(self):
+        first = self.sell(2)
+        second = self.sell(1)
+
+        self.assertEqual(self.on_hand(), Decimal("2.00"))
+        self.assertEqual(first.items.count(), 1)
+        self.assertEqual(StockMovement.objects.filter(movement_type=StockMovement.OUT).count(), 2)
+        self.assertEqual([first.receipt_number, second.receipt_number], ["MAIN-00000001", "MAIN-00000002"])
+        numbers = list(Payment.objects.order_by("sale_id").values_list("number", flat=True))
+        self.assertEqual(numbers, ["MAIN-P00000001", "MAIN-P00000002"])
+
+    def test_oversell_is_rejected_without_a_sale(self):
+        with self.assertRaisesMessage(ValueError, "Insufficient stock"):
+            self.sell(6)
+
+        self.assertEqual(self.on_hand(), Decimal("5.00"))
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(Payment.objects.exists())
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_stock_held_by_another_cart_is_not_sold(self):
+        hold("till-2", self.branch.pk, self.milk.pk, Decimal("4"))
+        hold("till-1", self.branch.pk, self.milk.pk, Decimal("1"))
+
+        with self.assertRaisesMessage(ValueError, "held by other carts"):
+            self.sell(2, holder="till-1")
+        self.sell(1, holder="till-1")
+
+        self.assertEqual(self.on_hand(), Decimal("4.00"))
+        self.assertEqual(list(StockReservation.objects.values_list("holder", flat=True)), ["till-2"])
+
+    def test_replay_with_the_same_key_does_not_sell_twice(self):
+        first = self.sell(2, idempotency_key="till-1-0001")
+        replayed = self.sell(2, idempotency_key="till-1-0001")
+
+        self.assertEqual(replayed.pk, first.pk)
+        self.assertTrue(replayed.replayed)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(self.on_hand(), Decimal("3.00"))
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_cached_customer_changed_elsewhere_is_looked_up_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.sell(1)
+        self.assertEqual(customer_cache.get(("phone", "01700000000")), first.customer_id)
+        # Another worker changes the phone; this worker's cache never hears of it
+        Customer.objects.filter(pk=first.customer_id).update(phone="01800000000", phone_key="01800000000")
+
+        second = self.sell(1)
+        self.assertNotEqual(second.customer_id, first.customer_id)
+        self.assertEqual(Customer.objects.get(pk=second.customer_id).phone, "01700000000")
+
+    @override_settings(CART_STORAGE="sales.cart_storage.MemoryCartStorage")
+    def test_replayed_checkout_keeps_the_current_cart_and_its_holds(self):
+        MemoryCartStorage.reset()
+        self.user.branches.add(self.branch)
+        first = self.sell(1, idempotency_key="till-1-0001")
+        self.client.force_login(self.user)
+        self.client.post(reverse("sales:cart-add"), {
+            "product": self.milk.id, "quantity": "2", "price": "2.00", "tax_rate": "5.00", "branch": self.branch.id,
+        })
+
+        response = self.client.post(reverse("sales:pos"), self.post("4.20", idempotency_key="till-1-0001"))
+
+        self.assertRedirects(response, reverse("sales:invoice", args=[first.pk]), fetch_redirect_response=False)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.assertEqual(StockReservation.objects.get().quantity, Decimal("2"))
+        request = response.wsgi_request
+        self.assertEqual(Cart(request).cart[str(self.milk.id)]["quantity"], "2")
+
+
+class CacheCartStorageTests(TestCase):
+    def storage(self, request):
+        storage = CacheCartStorage(request)
+        storage.lock_wait = 0.05
+        storage.load()
+        return storage
+
+    def test_write_fails_instead_of_running_without_the_lock(self):
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        first, second = self.storage(request), self.storage(request)
+        self.addCleanup(first.clear)
+
+        with first._locked():
+            with self.assertRaises(CartBusy):
+                second.save_line("1", {"quantity": "1"}, {})
+        second.save_line("1", {"quantity": "1"}, {})
+
+        self.assertEqual(self.storage(request).load()[0], {"1": {"quantity": "1"}})
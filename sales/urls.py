@@ -6,9 +6,12 @@ app_name = 'sales'
 urlpatterns = [
     path('pos/', views.PointsOfSale.as_view(), name='pos'),
     path('cart/add/', views.add_to_cart, name='cart-add'),
+    path('cart/add/batch/', views.add_many_to_cart, name='cart-add-batch'),
+    path('cart/scan/', views.scan_to_cart, name='cart-scan'),
     path('cart/<int:id>/delete/', views.cart_delete, name='cart-delete'),
     path('cart/<int:id>/increment/', views.cart_increment, name='cart-increment'),
     path('cart/<int:id>/decrement/', views.cart_decrement, name='cart-decrement'),
+    path('api/sales/batch/', views.SaleBatchAPIView.as_view(), name='api-sale-batch'),
 
     path('sale/', views.SaleList.as_view(), name='sale-list'),
     path('sale/add/', views.SaleAdd.as_view(), name='sale-add'),
@@ -1,16 +1,26 @@
+import json
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView, TemplateView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from .models import Sale, SaleItem
 from .forms import SaleForm, SaleItemForm
 from .cart import Cart
+from .cart_storage import CartBusy
 from django.http import HttpResponse, JsonResponse
-from inventory.models import Product
+from inventory.models import Category, Product
+from inventory.lookup import product_lookup
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from payments.models import PaymentMethod
 import sweetify
-from .services import create_sale
+from .services import create_sale, ingest_sales
+from .serializers import IngestedSaleSerializer, SaleBatchSerializer
 from django.urls import reverse_lazy
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+
+# Above this many changed lines a cart mutation re-renders the whole partial
+CART_FRAGMENT_LIMIT = 50
 
 class InvoiceView(DetailView):
     model = Sale
@@ -19,7 +29,7 @@ class InvoiceView(DetailView):
     def get_context_data(self, **kwargs):
         sale = self.get_object()
         context = super().get_context_data(**kwargs)
-        context["title"] = f'Invoice #{sale.id}'
+        context["title"] = f'Invoice #{sale.receipt_number or sale.id}'
         return context
 
 class PointsOfSale(LoginRequiredMixin, TemplateView):
@@ -27,15 +37,29 @@ class PointsOfSale(LoginRequiredMixin, TemplateView):
 
     def post(self, request):
         try:
-            cart = request.session.get("cart")
+            cart = Cart(request)
             post = request.POST
 
-            sale = create_sale(cart_data=cart, post_data=post, user=request.user)
-
-            request.session.pop("cart", None)
-            request.session.modified = True
-
-            sweetify.success(request, f'Sale #{sale.id} created successfully.', timer="3000")
+            sale = create_sale(
+                cart_data=cart.cart,
+                post_data=post,
+                user=request.user,
+                idempotency_key=request.headers.get("Idempotency-Key"),
+                holder=cart.holder,
+            )
+
+            if getattr(sale, 'replayed', False):
+                # The cart may hold a new basket since; leave it and its holds alone
+                sweetify.info(request, f'Sale #{sale.receipt_number} was already recorded.', timer="3000")
+                return redirect("sales:invoice", pk=sale.id)
+
+            # save_sale already released the cart's holds
+            try:
+                cart.clear(release=False)
+            except CartBusy:
+                sweetify.warning(request, f'Sale #{sale.receipt_number} created; clear the cart before the next sale.', timer="3000")
+                return redirect("sales:invoice", pk=sale.id)
+            sweetify.success(request, f'Sale #{sale.receipt_number} created successfully.', timer="3000")
             return redirect("sales:invoice", pk=sale.id)
         except Exception as e:
             sweetify.error(request, str(e), timer="3000")
@@ -46,12 +70,63 @@ class PointsOfSale(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         cart = Cart(self.request)
         context['cart'] = cart.cart
-        context['total'] = cart.total
-        context['total_qty'] = cart.total_qty
+        context['total'] = cart.total()
+        context['total_qty'] = cart.total_qty()
         context['payment_methods'] = PaymentMethod.objects.all().order_by('id')
         context["title"] = 'Points Of Sale'
         return context
     
+class SaleBatchAPIView(APIView):
+    """Accepts a batch of completed sales buffered by a terminal and reports a result per sale."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        batch = SaleBatchSerializer(data=request.data)
+        batch.is_valid(raise_exception=True)
+
+        results = {}
+        valid = []
+        for index, data in enumerate(batch.validated_data['sales']):
+            sale = IngestedSaleSerializer(data=data)
+            if sale.is_valid():
+                valid.append((index, sale.validated_data))
+            else:
+                results[index] = {"index": index, "status": "error", "error": sale.errors}
+
+        for result in ingest_sales(batch.validated_data['branch'], valid, request.user):
+            results[result["index"]] = result
+
+        ordered = [results[index] for index in sorted(results)]
+        return Response({
+            "created": sum(1 for result in ordered if result["status"] == "created"),
+            "replayed": sum(1 for result in ordered if result["status"] == "replayed"),
+            "failed": sum(1 for result in ordered if result["status"] == "error"),
+            "results": ordered,
+        })
+
+def render_cart(request, cart, changed=None, before=()):
+    """
+    Cart response for a mutation. Clients sending X-Cart-Fragments get only the
+    changed line rows and the totals as HTMX out-of-band swaps (rows that
+    are new are appended, rows that are gone are deleted); everyone else, and
+    large changes, get the full cart partial.
+    """
+    context = {
+        "cart": cart.cart,
+        "total": cart.total(),
+        "total_qty": cart.total_qty(),
+    }
+    if changed is None or not request.headers.get("X-Cart-Fragments") or len(changed) > CART_FRAGMENT_LIMIT:
+        return render(request, "sales/pos/cart/cart.html", context)
+
+    context["changed"] = [
+        (product_id, cart.cart.get(product_id), product_id not in before)
+        for product_id in dict.fromkeys(str(product_id) for product_id in changed)
+    ]
+    response = render(request, "sales/pos/cart/cart_update.html", context)
+    response["HX-Reswap"] = "none"
+    return response
+
 def add_to_cart(request):
     if request.method == "POST":
         product_id = request.POST.get("product")
@@ -78,6 +153,12 @@ def add_to_cart(request):
             tax_rate = Decimal("0.00")
 
         cart = Cart(request)
+        if request.POST.get("branch"):
+            try:
+                cart.set_branch(request.POST["branch"])
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=409 if isinstance(e, CartBusy) else 400)
+        before = set(cart.cart)
 
         cart_item = {
             "id": str(product_obj.id),
@@ -87,46 +168,149 @@ def add_to_cart(request):
             "tax_rate": str(tax_rate),
         }
 
-        cart.add(**cart_item)
-
-        return render(request, "sales/pos/cart/cart.html", {
-            "cart": cart.cart,
-            "total": cart.total(),
-            "total_qty": cart.total_qty(),
-        })
-    cart = request.session.get("cart", {})
-    return render(request, 'sales/pos/cart/cart.html', {"cart": cart})
+        try:
+            cart.add(**cart_item)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=409)
 
-def cart_delete(request, id):
+        return render_cart(request, cart, [product_obj.id], before)
     cart = Cart(request)
-    cart.remove(product_id=id)
-    
-    return render(request, "sales/pos/cart/cart.html", {
+    return render(request, 'sales/pos/cart/cart.html', {
         "cart": cart.cart,
         "total": cart.total(),
         "total_qty": cart.total_qty(),
     })
 
+def scan_line(entry, quantity):
+    return {
+        "id": str(entry.id),
+        "name": entry.name,
+        "price": entry.base_price,
+        "qty": quantity,
+        "tax_rate": entry.tax_rate,
+    }
+
+def scan_to_cart(request):
+    """
+    Add one scanned barcode or SKU to the cart at the catalogue price. The
+    product is resolved through the in-process lookup, so a hit costs no query.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    entry = product_lookup.get(request.POST.get("code", ""))
+    if entry is None:
+        return JsonResponse({"error": "Unknown barcode or SKU"}, status=404)
+
+    try:
+        quantity = Decimal(request.POST.get("quantity") or "1")
+    except InvalidOperation:
+        return JsonResponse({"error": "Invalid numeric values"}, status=400)
+    if not quantity.is_finite():
+        return JsonResponse({"error": "Invalid numeric values"}, status=400)
+    if quantity <= 0:
+        return JsonResponse({"error": "Quantity must be greater than zero"}, status=400)
+
+    cart = Cart(request)
+    if request.POST.get("branch"):
+        try:
+            cart.set_branch(request.POST["branch"])
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=409 if isinstance(e, CartBusy) else 400)
+    before = set(cart.cart)
+
+    try:
+        cart.add(**scan_line(entry, quantity))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=409)
+
+    return render_cart(request, cart, [entry.id], before)
+
+def add_many_to_cart(request):
+    """
+    Apply a burst of scans in one request: items is a JSON list of
+    {"barcode": ..., "quantity": ...} or {"product": id, "quantity": ...}
+    (barcode also matches the SKU). Products are resolved and priced through
+    the in-process product lookup; unknown codes are skipped and reported in
+    the HX-Trigger header.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    try:
+        payload = json.loads(request.body) if request.content_type == "application/json" else request.POST
+        items = payload.get("items", [])
+        if isinstance(items, str):
+            items = json.loads(items)
+        scans = [
+            (str(item.get("barcode") or "").strip(), item.get("product"), Decimal(str(item.get("quantity", 1))))
+            for item in items
+        ]
+    except (ValueError, TypeError, AttributeError, InvalidOperation):
+        return JsonResponse({"error": "Invalid items"}, status=400)
+    if not all(quantity.is_finite() for _, _, quantity in scans):
+        return JsonResponse({"error": "Invalid items"}, status=400)
+
+    if any(quantity <= 0 for _, _, quantity in scans):
+        return JsonResponse({"error": "Quantity must be greater than zero"}, status=400)
+
+    lines = []
+    missing = []
+    for code, product_id, quantity in scans:
+        if code:
+            entry = product_lookup.get(code)
+        else:
+            entry = product_lookup.get_by_id(product_id) if str(product_id or "").isdigit() else None
+        if entry is None:
+            missing.append(code or product_id)
+            continue
+        lines.append(scan_line(entry, quantity))
+
+    cart = Cart(request)
+    if payload.get("branch"):
+        try:
+            cart.set_branch(payload["branch"])
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=409 if isinstance(e, CartBusy) else 400)
+    before = set(cart.cart)
+
+    try:
+        changed = cart.add_many(lines)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=409)
+
+    response = render_cart(request, cart, changed, before)
+    if missing:
+        response["HX-Trigger"] = json.dumps({"cartMissing": {"codes": missing}})
+    return response
+
+def cart_delete(request, id):
+    cart = Cart(request)
+    try:
+        cart.remove(product_id=id)
+    except CartBusy as e:
+        return JsonResponse({"error": str(e)}, status=409)
+
+    return render_cart(request, cart, [id])
+
 def cart_increment(request, id):
     cart = Cart(request)
-    cart.increment(product_id=id)
+    try:
+        cart.increment(product_id=id)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=409)
 
-    return render(request, "sales/pos/cart/cart.html", {
-        "cart": cart.cart,
-        "total": cart.total(),
-        "total_qty": cart.total_qty(),
-    })
+    return render_cart(request, cart, [id], cart.cart)
 
 
 def cart_decrement(request, id):
     cart = Cart(request)
-    cart.decrement(product_id=id)
+    try:
+        cart.decrement(product_id=id)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=409)
 
-    return render(request, "sales/pos/cart/cart.html", {
-        "cart": cart.cart,
-        "total": cart.total(),
-        "total_qty": cart.total_qty(),
-    })
+    return render_cart(request, cart, [id], cart.cart)
 
 class SaleList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     model = Sale
@@ -199,6 +383,13 @@ class SaleItemList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
     form_class = SaleItemForm
     template_name = 'sales/saleitem/saleitem_list.html'
     permission_required = ['sales:view_sale_item']
+
+    def get_queryset(self):
+        items = super().get_queryset()
+        category = self.request.GET.get('category', '')
+        if category.isdigit():
+            items = items.filter(Category.subtree_q(int(category), 'product__category'))
+        return items
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -0,0 +1,93 @@
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+STAMPED = {}
+
+
+def next_version(current=0):
+    """
+    Next value of a row's version counter. Versions only grow, and are at least
+    the current time in microseconds, so a later save anywhere in the table
+    always beats every earlier one and the table's newest version moves.
+    """
+    return max((current or 0) + 1, time.time_ns() // 1000)
+
+
+def register_stamp(model, field, deletions=None):
+    """
+    Track model's version stamp from field: an indexed auto_now datetime or a
+    next_version() counter. deletions is an optional (tombstone model, indexed
+    datetime field) recording deleted rows; without it deletes are caught by
+    counting the rows, which is only cheap for small tables.
+    """
+    STAMPED[model] = (field, deletions)
+
+
+def model_stamp(model):
+    """
+    (deletion marker, newest change as an aware datetime) of a registered
+    model, read from the database on every call: a per-process cache would keep
+    serving 304s after another worker's write. The marker is the newest
+    tombstone time when the model has tombstones, else the row count.
+    """
+    field, deletions = STAMPED[model]
+    if deletions:
+        tombstones, deleted_field = deletions
+        removed = tombstones._base_manager.aggregate(last=Max(deleted_field))["last"]
+        marker = removed.timestamp() if removed else 0
+        last = model._base_manager.aggregate(last=Max(field))["last"]
+    else:
+        row = model._base_manager.aggregate(count=Count("pk"), last=Max(field))
+        marker, last = row["count"], row["last"]
+
+    if isinstance(last, int):
+        last = datetime.fromtimestamp(last / 1_000_000, tz=dt_timezone.utc) if last else None
+    return marker, last
+
+
+def stamps_etag(request, stamps, headers=()):
+    parts = [request.get_full_path()]
+    parts.extend(request.headers.get(header, "") for header in headers)
+    for marker, last in stamps:
+        parts.append(f"{marker}:{last.timestamp() if last else ''}")
+    return hashlib.md5("|".join(parts).encode()).hexdigest()
+
+
+def stamps_last_modified(stamps):
+    changes = [last for _, last in stamps if last]
+    return max(changes) if changes else None
+
+
+def conditional(*models, headers=()):
+    """
+    ETag/Last-Modified for a view whose response depends only on the URL, the
+    given request headers and the rows of models: a matching If-None-Match or
+    If-Modified-Since gets a 304 without calling the view. The stamps are read
+    once per request, one or two index lookups per model. Responses are private
+    and always revalidated.
+    """
+    def decorator(view):
+        key = f"_stamps_{id(decorator)}"
+
+        def stamps(request):
+            if key not in request.__dict__:
+                request.__dict__[key] = [model_stamp(model) for model in models]
+            return request.__dict__[key]
+
+        checked = condition(
+            etag_func=lambda request, *args, **kwargs: stamps_etag(request, stamps(request), headers),
+            last_modified_func=lambda request, *args, **kwargs: stamps_last_modified(stamps(request)),
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = checked(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
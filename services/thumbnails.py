@@ -0,0 +1,179 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels of each derivative; every size is written as WebP and JPEG
+SIZES = {"small": 64, "medium": 240, "large": 640}
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+
+_lock = threading.Lock()
+_pool = None
+_pending = set()
+
+
+def thumbnail_name(name, size, ext="webp"):
+    """thumbs/<stem of the original>/<size>.<ext>; the stem is the content hash of uploads (see ContentHashStorage)."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f"thumbs/{stem}/{size}.{ext}"
+
+
+def derivative_names(name):
+    return [thumbnail_name(name, size, ext) for size in SIZES for ext in FORMATS]
+
+
+def marker_field(field):
+    """<field>_thumbnailed: the image name of <field> whose derivatives are stored, so URLs need no storage call."""
+    return f"{field}_thumbnailed"
+
+
+def mark_thumbnailed(field_file):
+    """Record on every row holding this image that its derivatives are ready."""
+    field = field_file.field
+    marker = marker_field(field.name)
+    changes = {marker: field_file.name}
+    if any(model_field.name == "updated_at" for model_field in field.model._meta.concrete_fields):
+        # Moves the ETag and catalog delta on, so clients fetch the thumbnail URL
+        changes["updated_at"] = timezone.now()
+    field.model._default_manager.filter(**{field.name: field_file.name}).exclude(**{marker: field_file.name}).update(**changes)
+
+
+def render(data, sizes=SIZES, quality=80):
+    """
+    Runs in the pool, so it only uses Pillow: original image bytes in,
+    {"<size>.<ext>": bytes} out.
+    """
+    out = {}
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        for size, edge in sizes.items():
+            thumb = image.copy()
+            thumb.thumbnail((edge, edge), Image.LANCZOS)
+            for ext, fmt in FORMATS.items():
+                frame = thumb
+                if fmt == "JPEG" and thumb.mode != "RGB":
+                    frame = Image.new("RGB", thumb.size, "white")
+                    frame.paste(thumb, mask=thumb.convert("RGBA").getchannel("A"))
+                buffer = io.BytesIO()
+                if fmt == "JPEG":
+                    frame.save(buffer, fmt, quality=quality, optimize=True, progressive=True)
+                else:
+                    frame.save(buffer, fmt, quality=quality, method=4)
+                out[f"{size}.{ext}"] = buffer.getvalue()
+    return out
+
+
+def get_pool():
+    global _pool
+
+    with _lock:
+        if _pool is None:
+            # spawn: the workers never touch Django, and forking a threaded server is unsafe
+            _pool = ProcessPoolExecutor(settings.THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def store_thumbnails(field_file, derivatives):
+    storage = field_file.storage
+    save = getattr(storage, "save_as", storage.save)
+    for key, data in derivatives.items():
+        size, ext = key.split(".")
+        name = thumbnail_name(field_file.name, size, ext)
+        if not storage.exists(name):
+            save(name, ContentFile(data))
+
+
+def _finished(field_file, future):
+    try:
+        store_thumbnails(field_file, future.result())
+        mark_thumbnailed(field_file)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", field_file.name)
+    finally:
+        with _lock:
+            _pending.discard(field_file.name)
+
+
+def queue_thumbnails(field_file):
+    """
+    Generate the derivatives of an image in the process pool (inline when
+    THUMBNAIL_WORKERS is 0) and mark the rows holding it once they are
+    stored. Images whose derivatives exist (the rows are just marked), or are
+    already queued, are skipped, so identical uploads are only processed once.
+    Returns the future, or None when there was nothing to do.
+    """
+    name = field_file.name if field_file else None
+    if not name:
+        return None
+
+    storage = field_file.storage
+    # Derivatives are written in order, so the last one marks a finished set
+    if storage.exists(derivative_names(name)[-1]):
+        mark_thumbnailed(field_file)
+        return None
+
+    with _lock:
+        if name in _pending:
+            return None
+        _pending.add(name)
+
+    try:
+        with storage.open(name, "rb") as original:
+            data = original.read()
+    except OSError:
+        with _lock:
+            _pending.discard(name)
+        logger.warning("Cannot read %s for thumbnails", name)
+        return None
+
+    if not settings.THUMBNAIL_WORKERS:
+        future = Future()
+        try:
+            future.set_result(render(data, SIZES, settings.THUMBNAIL_QUALITY))
+        except Exception as exc:
+            future.set_exception(exc)
+        _finished(field_file, future)
+        return future
+
+    future = get_pool().submit(render, data, SIZES, settings.THUMBNAIL_QUALITY)
+    future.add_done_callback(lambda done: _finished(field_file, done))
+    return future
+
+
+def thumbnail_url(storage, name, size="small", ext="webp", thumbnailed=None):
+    """
+    URL of a derivative of the stored image name, or of the original while its
+    thumbnails are pending; thumbnailed is the row's marker (see marker_field).
+    """
+    if not name:
+        return None
+    return storage.url(thumbnail_name(name, size, ext) if thumbnailed == name else name)
+
+
+def field_thumbnail_url(field_file, size="small", ext="webp"):
+    """thumbnail_url for an image field of a model instance, read from its marker."""
+    if not field_file:
+        return None
+    thumbnailed = getattr(field_file.instance, marker_field(field_file.field.name), None)
+    return thumbnail_url(field_file.storage, field_file.name, size, ext, thumbnailed)
+
+
+def register_thumbnails(model, field):
+    """Queue thumbnails for model.<field> after every committed save that leaves an image on it."""
+
+    def saved(sender, instance, **kwargs):
+        field_file = getattr(instance, field)
+        if field_file:
+            transaction.on_commit(lambda: queue_thumbnails(field_file))
+
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=f"thumbnails-{model._meta.label_lower}-{field}")
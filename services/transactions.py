@@ -0,0 +1,89 @@
+import logging
+import random
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE codes PostgreSQL uses for serialization failures and deadlocks.
+TRANSIENT_SQLSTATES = {"40001", "40P01"}
+TRANSIENT_MESSAGES = ("database is locked", "deadlock", "could not serialize access", "lock wait timeout")
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def is_transient_error(exc):
+    cause = exc.__cause__
+    sqlstate = getattr(cause, "pgcode", None) or getattr(cause, "sqlstate", None)
+    if sqlstate in TRANSIENT_SQLSTATES:
+        return True
+
+    message = str(exc).lower()
+    return isinstance(exc, OperationalError) and any(text in message for text in TRANSIENT_MESSAGES)
+
+
+def _record(name, **counts):
+    with _stats_lock:
+        entry = _stats.setdefault(name, {"calls": 0, "conflicts": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0})
+        for key, value in counts.items():
+            entry[key] += value
+
+
+def contention_stats():
+    """Snapshot of the per-function contention counters of this process."""
+    with _stats_lock:
+        return {name: dict(entry) for name, entry in _stats.items()}
+
+
+def reset_contention_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def retry_on_conflict(func=None, *, attempts=None, base_delay=None, max_delay=None):
+    """
+    Re-run a transactional function when the database reports a deadlock,
+    serialization failure or lock timeout, with jittered exponential backoff.
+
+    The decorated function must open its own transaction (put this decorator
+    outside transaction.atomic); when it is called from inside an outer atomic
+    block the error is re-raised untouched, since only the outermost
+    transaction can be safely retried.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            max_attempts = attempts or settings.DB_RETRY_ATTEMPTS
+            delay = base_delay if base_delay is not None else settings.DB_RETRY_BASE_DELAY
+            ceiling = max_delay if max_delay is not None else settings.DB_RETRY_MAX_DELAY
+            _record(name, calls=1)
+
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except DatabaseError as exc:
+                    if connection.in_atomic_block or not is_transient_error(exc):
+                        raise
+
+                    _record(name, conflicts=1)
+                    if attempt == max_attempts:
+                        _record(name, failures=1)
+                        logger.warning("%s gave up after %s attempts: %s", name, attempt, exc)
+                        raise
+
+                    wait = min(ceiling, delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                    _record(name, retries=1, wait_seconds=wait)
+                    logger.info("%s hit a transient conflict (attempt %s), retrying in %.3fs: %s", name, attempt, wait, exc)
+                    time.sleep(wait)
+
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
@@ -1,21 +1,42 @@
+import hashlib
 import os
-import uuid
-from django.utils.text import slugify
+from django.core.files.storage import FileSystemStorage
 
 def logo_upload_path(instance, filename):
-    root, ext = os.path.splitext(filename)
-    unique_identity = slugify(instance.name) +'-'+ uuid.uuid4().hex
-    filename = f'{unique_identity}{ext}'
     return os.path.join('logo', filename)
 
 def avatar_upload_path(instance, filename):
-    root, ext = os.path.splitext(filename)
-    unique_identity = slugify(instance.username) +'-'+ uuid.uuid4().hex
-    filename = f'{unique_identity}{ext}'
     return os.path.join('avatar', filename)
 
 def product_image_upload_path(instance, filename):
-    root, ext = os.path.splitext(filename)
-    unique_identity = slugify(instance.name) +'-'+ uuid.uuid4().hex
-    filename = f'{unique_identity}{ext}'
-    return os.path.join('product', filename)
\ No newline at end of file
+    return os.path.join('product', filename)
+
+def content_hash(content, chunk_size=64 * 1024):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(chunk_size), b''):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    Saves uploads as <upload dir>/<sha256 of the content><ext>, so the same
+    image uploaded twice is stored (and thumbnailed) once. Files may be shared
+    between rows, which is why nothing here deletes them.
+    """
+
+    def save(self, name, content, max_length=None):
+        directory, filename = os.path.split(name)
+        root, ext = os.path.splitext(filename)
+        name = os.path.join(directory, content_hash(content) + ext.lower())
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_as(self, name, content):
+        """Save under exactly name, for files derived from an upload such as thumbnails."""
+        return super().save(name, content)
+
+def image_storage():
+    return ContentHashStorage()